@@ -1 +1 @@
-from . import database, models
\ No newline at end of file
+from . import database, models, catalog, fsm_storage, query_stats
\ No newline at end of file
@@ -0,0 +1,161 @@
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from datetime import datetime
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина n-граммы в индексе
+MAX_GRAM = 3
+
+
+def normalize(text: str | None) -> str:
+    """Приводит строку к виду, в котором она хранится в индексе и в ключах поиска."""
+    return " ".join((text or "").lower().split())
+
+
+def _grams(text: str) -> set:
+    # Все подстроки длиной от 1 до MAX_GRAM: короткие запросы ("M", "пи")
+    # тоже отвечаются одним обращением к словарю
+    return {
+        text[i:i + n]
+        for n in range(1, MAX_GRAM + 1)
+        for i in range(len(text) - n + 1)
+    }
+
+
+@dataclass
+class CatalogEntry:
+    id: int
+    name: str
+    size: str | None
+    quantity: int
+    costume_uuid: str
+    image_url: str
+    thumbnail_url: str | None = None
+
+    @classmethod
+    def from_row(cls, row) -> "CatalogEntry":
+        return cls(
+            id=row.id,
+            name=row.name,
+            size=row.size,
+            quantity=row.quantity or 0,
+            costume_uuid=str(row.costume_uuid),
+            image_url=row.image_url,
+            thumbnail_url=row.thumbnail_url
+        )
+
+
+class CatalogIndex:
+    """
+    Инвертированный n-граммный индекс каталога костюмов в памяти процесса.
+
+    Отвечает на inline-запросы без обращения к БД. Строится целиком при старте
+    и периодически, между пересборками обновляется точечно через upsert/remove.
+    """
+
+    def __init__(self):
+        self._entries: dict[int, CatalogEntry] = {}
+        self._keys: dict[int, tuple] = {}
+        self._postings: dict[str, set] = defaultdict(set)
+        self.ready = False
+        self.built_at: datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def matches(query: str, name: str, size: str) -> bool:
+        """Проверяет, подходит ли костюм (нормализованные name/size) под запрос."""
+        return not query or query in name or query == size
+
+    def build(self, entries) -> None:
+        """Полностью пересобирает индекс и атомарно подменяет текущий."""
+        fresh = CatalogIndex()
+        for entry in entries:
+            fresh.upsert(entry)
+
+        self._entries = fresh._entries
+        self._keys = fresh._keys
+        self._postings = fresh._postings
+        self.ready = True
+        self.built_at = datetime.now()
+        logger.info(f"Catalog index built: {len(self._entries)} costumes")
+
+    def upsert(self, entry: CatalogEntry) -> None:
+        if entry.id in self._entries:
+            self.remove(entry.id)
+
+        key = (normalize(entry.name), normalize(entry.size))
+        self._entries[entry.id] = entry
+        self._keys[entry.id] = key
+        for gram in _grams(key[0]) | _grams(key[1]):
+            self._postings[gram].add(entry.id)
+
+    def remove(self, costume_id: int) -> None:
+        key = self._keys.pop(costume_id, None)
+        self._entries.pop(costume_id, None)
+        if key is None:
+            return
+
+        for gram in _grams(key[0]) | _grams(key[1]):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(costume_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def set_quantity(self, costume_id: int, quantity: int) -> CatalogEntry | None:
+        """Обновляет остаток костюма без пересчета n-грамм. Возвращает прежнюю запись."""
+        entry = self._entries.get(costume_id)
+        if entry is None:
+            return None
+
+        self._entries[costume_id] = replace(entry, quantity=quantity)
+        return entry
+
+    def get(self, costume_id: int) -> CatalogEntry | None:
+        return self._entries.get(costume_id)
+
+    def _candidates(self, query: str):
+        if not query:
+            return self._entries.keys()
+        if len(query) <= MAX_GRAM:
+            return self._postings.get(query, ())
+
+        postings = sorted(
+            (self._postings.get(query[i:i + MAX_GRAM], set()) for i in range(len(query) - MAX_GRAM + 1)),
+            key=len
+        )
+        return set.intersection(*postings)
+
+    def search(self, query: str, limit: int, offset: int = 0) -> list:
+        """
+        Ищет костюмы в наличии по подстроке названия или точному размеру.
+
+        Сначала идут совпадения по размеру и по началу названия/слова, затем остальные.
+        Возвращает не более limit костюмов, пропустив первые offset.
+        """
+        query = normalize(query)
+        found = []
+
+        for costume_id in self._candidates(query):
+            entry = self._entries[costume_id]
+            name, size = self._keys[costume_id]
+            if entry.quantity <= 0 or not self.matches(query, name, size):
+                continue
+
+            if query and (size == query or name.startswith(query)):
+                rank = 0
+            elif query and f" {query}" in f" {name}":
+                rank = 1
+            else:
+                rank = 2
+            found.append((rank, name, entry))
+
+        # id разрешает равенство, как в SQL: иначе порядок зависел бы от перебора кандидатов
+        # и одноименные костюмы разных размеров дублировались бы или терялись между страницами
+        best = heapq.nsmallest(offset + limit, found, key=lambda item: (item[0], item[1], item[2].id))
+        return [entry for _, _, entry in best[offset:]]
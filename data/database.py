@@ -1,15 +1,20 @@
-from sqlalchemy import select, insert, update, delete
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy import select, insert, update, delete, func, or_, text, literal, literal_column, true, tuple_, cast, BigInteger, Integer
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine, AsyncConnection
 from sqlalchemy.exc import NoResultFound, OperationalError
-from .models import Base, Users, Costumes, Cart, Role
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by, insert as pg_insert
+from .models import Base, Users, Costumes, Cart, ReturnRequest, Role, ImageHash, COSTUME_KEY
+from .catalog import CatalogIndex, CatalogEntry, normalize
+from .query_stats import QueryStats
+from utils.cache import TTLCache
 from dotenv import load_dotenv
 import os
-from typing import Any, Awaitable, Callable, Dict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 import asyncio
 import logging
 import asyncpg
+import uuid
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -17,6 +22,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Telegram принимает не более 50 результатов на один inline-ответ
+SEARCH_LIMIT = 50
+
+# Колонки костюма, которые хранятся в индексе каталога
+CATALOG_COLUMNS = (
+    Costumes.id, Costumes.name, Costumes.size, Costumes.quantity,
+    Costumes.costume_uuid, Costumes.image_url, Costumes.thumbnail_url
+)
+
+# Пользователи по Telegram id (включая отсутствующих), чтобы меню по роли не ходило в БД
+user_cache = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '600'))
+)
+_MISSING = object()
+
+# Строк на одной странице админских отчетов
+REPORT_PAGE_SIZE = int(os.getenv('REPORT_PAGE_SIZE', '10'))
+# Срок аренды, после которого костюм считается просроченным
+RENTAL_DAYS = int(os.getenv('RENTAL_DAYS', '7'))
+
 class DataBase:
     def __init__(self):
         try:
@@ -35,6 +61,20 @@ class DataBase:
             
             self.DATABASE_URL = f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+            # Статистика SQL-запросов и лог медленных запросов
+            self.query_stats = QueryStats(slow_ms=float(os.getenv('SQL_SLOW_MS', '200')))
+
+            # Каталог костюмов в памяти для inline-поиска
+            self.catalog = CatalogIndex()
+            self.CATALOG_RESYNC_SECONDS = int(os.getenv('CATALOG_RESYNC_SECONDS', '300'))
+            self._catalog_task = None
+
+            # Отрисованные inline-ответы по ключу (нормализованный запрос, смещение)
+            self.inline_cache = TTLCache(
+                maxsize=int(os.getenv('INLINE_CACHE_SIZE', '1024')),
+                ttl=float(os.getenv('INLINE_CACHE_TTL', '300'))
+            )
+
         except Exception as e:
             logger.error(f"Error during database initialization: {e}")
             raise
@@ -68,7 +108,8 @@ class DataBase:
             # Создаем engine только после того, как убедились, что база существует
             self.engine = create_async_engine(
                 self.DATABASE_URL,
-                echo=True,
+                # Полный текст запросов в логе только по явному запросу
+                echo=os.getenv('SQL_ECHO', 'false').lower() == 'true',
                 pool_pre_ping=True,
                 pool_size=5,
                 max_overflow=10,
@@ -78,6 +119,8 @@ class DataBase:
                 }
             )
             
+            self.query_stats.attach(self.engine)
+
             self.async_session = async_sessionmaker(
                 bind=self.engine,
                 class_=AsyncSession,
@@ -111,19 +154,81 @@ class DataBase:
             
             # Создаем таблицы
             async with self.engine.begin() as conn:
+                # Расширение для триграммных индексов поиска костюмов
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
                 await conn.run_sync(Base.metadata.create_all)
             logger.info("Database tables created successfully!")
+
+            # Строим индекс каталога и запускаем периодическую пересборку
+            await self.load_catalog()
+            self._catalog_task = asyncio.create_task(self._resync_catalog())
         except Exception as e:
             logger.error(f"Error creating database tables: {e}")
             raise
 
+    async def load_catalog(self):
+        async with self.async_session() as session:
+            result = await session.execute(select(*CATALOG_COLUMNS))
+            self.catalog.build(CatalogEntry.from_row(row) for row in result)
+        # После полной пересборки неизвестно, что поменялось, сбрасываем кэш целиком
+        self.inline_cache.clear()
+
+    async def _resync_catalog(self):
+        # Страховка от изменений в обход бота (скрипты, ручные правки в БД)
+        while True:
+            await asyncio.sleep(self.CATALOG_RESYNC_SECONDS)
+            try:
+                await self.load_catalog()
+            except Exception as e:
+                logger.error(f"Error resyncing catalog index: {e}")
+
+    async def refresh_costume(self, costume_id: int):
+        """Перечитывает один костюм из БД и обновляет его в индексе каталога."""
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    select(*CATALOG_COLUMNS).where(Costumes.id == costume_id)
+                )
+                row = result.first()
+
+            old_entry = self.catalog.get(costume_id)
+            new_entry = CatalogEntry.from_row(row) if row else None
+            if new_entry:
+                self.catalog.upsert(new_entry)
+            else:
+                self.catalog.remove(costume_id)
+            self._invalidate_inline_cache(old_entry, new_entry)
+        except Exception as e:
+            logger.error(f"Error refreshing costume {costume_id} in catalog: {e}")
+
+    def update_catalog_quantity(self, costume_id: int, quantity: int):
+        """Применяет к индексу каталога уже известный новый остаток костюма."""
+        old_entry = self.catalog.set_quantity(costume_id, quantity)
+        if old_entry is None:
+            # Костюма еще нет в индексе: подтянем его при ближайшей пересборке
+            return
+        self._invalidate_inline_cache(old_entry)
+
+    def _invalidate_inline_cache(self, *entries: CatalogEntry | None):
+        # Сбрасываем только ответы на запросы, под которые подходит измененный костюм
+        keys = [(normalize(entry.name), normalize(entry.size)) for entry in entries if entry]
+        self.inline_cache.invalidate_where(
+            lambda key: any(CatalogIndex.matches(key[0], name, size) for name, size in keys)
+        )
+
     async def get(self, user_id: int) -> Users | None:
+        cached = user_cache.get(user_id, _MISSING)
+        if cached is not _MISSING:
+            return cached
+
         try:
             async with self.async_session() as session:
                 result = await session.execute(
                     select(Users).where(Users.id == user_id)
                 )
-                return result.scalar_one_or_none()
+                user = result.scalar_one_or_none()
+            user_cache.set(user_id, user)
+            return user
         except Exception as e:
             logger.error(f"Error getting user: {e}")
             return None
@@ -136,16 +241,26 @@ class DataBase:
                     session.add(new_user)
                     await session.commit()
                     logger.info(f"User {kwargs.get('full_name')} successfully inserted!")
+            user_cache.pop(kwargs.get('id'))
         except Exception as e:
             logger.error(f"Error inserting user: {e}")
             raise
 
+    def cache_stats(self) -> dict:
+        """Счетчики попаданий и промахов кэшей пользователей и inline-ответов."""
+        return {
+            "users": user_cache.stats(),
+            "inline": self.inline_cache.stats()
+        }
+
     async def get_session(self) -> AsyncSession:
         return self.async_session()
 
     async def close(self):
         try:
             logger.info("Closing database connection...")
+            if self._catalog_task:
+                self._catalog_task.cancel()
             await self.engine.dispose()
             logger.info("Database connection closed successfully")
         except Exception as e:
@@ -169,6 +284,7 @@ class UserCRUD:
         new_user = Users(full_name=full_name, phone=phone, role=Role.User)
         session.add(new_user)
         await session.commit()
+        user_cache.pop(new_user.id)
         return new_user
 
     @staticmethod
@@ -188,6 +304,7 @@ class UserCRUD:
         if user:
             user.role = new_role
             await session.commit()
+            user_cache.pop(user_id)
             return user
         else:
             raise NoResultFound(f"User with id {user_id} not found.")
@@ -200,6 +317,7 @@ class UserCRUD:
         if user:
             await session.delete(user)
             await session.commit()
+            user_cache.pop(user_id)
             return True
         return False
 
@@ -213,6 +331,55 @@ class CostumeCRUD:
         await session.commit()
         return new_costume
 
+    @staticmethod
+    def _on_conflict_merge(stmt):
+        """
+        Существующий костюм с тем же названием и размером не дублируется:
+        его количество увеличивается, а фото остается прежним (пустые поля превью заполняются).
+        RETURNING отдает id, итоговое количество и признак inserted.
+        """
+        return stmt.on_conflict_do_update(
+            index_elements=[literal_column(expression) for expression in COSTUME_KEY],
+            set_={
+                "quantity": func.coalesce(Costumes.quantity, 0) + stmt.excluded.quantity,
+                "thumbnail_url": func.coalesce(Costumes.thumbnail_url, stmt.excluded.thumbnail_url),
+                "photo_file_id": func.coalesce(Costumes.photo_file_id, stmt.excluded.photo_file_id)
+            }
+        ).returning(Costumes.id, Costumes.quantity, literal_column("xmax = 0").label("inserted"))
+
+    @staticmethod
+    async def upsert(session: AsyncSession, name: str, image_url: str, size: str = None, quantity: int = 1,
+                     thumbnail_url: str = None, photo_file_id: str = None):
+        """
+        Добавляет костюм или пополняет количество уже существующего за один запрос.
+
+        Returns:
+            Row: (id, quantity, inserted)
+        """
+        stmt = pg_insert(Costumes).values(
+            name=name.strip(),
+            size=(size or "").strip() or None,
+            quantity=quantity,
+            image_url=image_url,
+            thumbnail_url=thumbnail_url,
+            photo_file_id=photo_file_id,
+            costume_uuid=uuid.uuid4()
+        )
+        result = await session.execute(CostumeCRUD._on_conflict_merge(stmt))
+        row = result.one()
+        await session.commit()
+        return row
+
+    @staticmethod
+    async def upsert_from_select(conn: AsyncSession | AsyncConnection, columns: list, source) -> list:
+        """
+        Пакетный вариант upsert: строки берутся из запроса source (например, из временной таблицы).
+        Ключи в source должны быть уникальны. Транзакцией управляет вызывающий.
+        """
+        stmt = pg_insert(Costumes).from_select(columns, source)
+        result = await conn.execute(CostumeCRUD._on_conflict_merge(stmt))
+        return result.all()
+
     @staticmethod
     async def get_costume_by_id(session: AsyncSession, costume_id: int) -> Costumes:
         stmt = select(Costumes).filter(Costumes.id == costume_id)
@@ -222,6 +389,74 @@ class CostumeCRUD:
             raise NoResultFound(f"Costume with id {costume_id} not found.")
         return costume
 
+    @staticmethod
+    async def search(session: AsyncSession, query: str, limit: int = SEARCH_LIMIT, offset: int = 0) -> list:
+        """
+        Поиск доступных костюмов по названию или размеру с ранжированием по релевантности.
+
+        Использует полнотекстовый индекс (русская морфология) и триграммный индекс
+        по названию, размер сравнивается целиком без учета регистра.
+        """
+        query = query.strip().lower()
+        stmt = select(Costumes).where(Costumes.quantity > 0)
+
+        if query:
+            pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            ts_query = func.websearch_to_tsquery('russian', query)
+            stmt = stmt.where(
+                or_(
+                    Costumes.search_vector.op('@@')(ts_query),
+                    Costumes.name.ilike(f"%{pattern}%", escape='\\'),
+                    func.lower(Costumes.size) == query
+                )
+            ).order_by(
+                (func.ts_rank(Costumes.search_vector, ts_query) + func.similarity(Costumes.name, query)).desc(),
+                Costumes.name
+            )
+        else:
+            stmt = stmt.order_by(Costumes.name)
+
+        result = await session.execute(stmt.order_by(Costumes.id).limit(limit).offset(offset))
+        return result.scalars().all()
+
+    @staticmethod
+    async def reserve(session: AsyncSession, costume_uuid: str, user_id: int):
+        """
+        Атомарно выдает пользователю одну единицу костюма.
+
+        Уменьшение остатка и запись в корзину выполняются одним запросом (CTE
+        с UPDATE ... RETURNING), поэтому последний костюм не достанется двоим.
+
+        Returns:
+            Строка (id, name, size, quantity, cart_id) с уже уменьшенным остатком
+            или None, если костюма нет в наличии.
+        """
+        reserved = (
+            update(Costumes)
+            .where(Costumes.costume_uuid == costume_uuid, Costumes.quantity > 0)
+            .values(quantity=Costumes.quantity - 1)
+            .returning(Costumes.id, Costumes.name, Costumes.size, Costumes.quantity)
+            .cte('reserved')
+        )
+        added = (
+            insert(Cart)
+            .from_select(
+                ['user_id', 'costume_id', 'created_at'],
+                select(literal(user_id, BigInteger), reserved.c.id, func.now())
+            )
+            .returning(Cart.id)
+            .cte('added')
+        )
+        stmt = select(
+            reserved.c.id, reserved.c.name, reserved.c.size, reserved.c.quantity,
+            added.c.id.label('cart_id')
+        ).select_from(reserved.join(added, true()))
+
+        result = await session.execute(stmt)
+        row = result.first()
+        await session.commit()
+        return row
+
     @staticmethod
     async def update_costume_quantity(session: AsyncSession, costume_id: int, new_quantity: int) -> Costumes:
         stmt = select(Costumes).filter(Costumes.id == costume_id)
@@ -283,3 +518,198 @@ class CartCRUD:
             await session.commit()
             return True
         return False
+
+
+class Page(NamedTuple):
+    rows: list
+    has_prev: bool
+    has_next: bool
+
+
+def _keyset_page_query(stmt, key: tuple, after: tuple | None, before: tuple | None, limit: int):
+    """
+    Ограничивает запрос одной страницей по ключу key без OFFSET.
+
+    after — ключ последней строки предыдущей страницы (листаем вперед),
+    before — ключ первой строки следующей страницы (листаем назад).
+    Берется на одну строку больше, чтобы узнать, есть ли что-то дальше.
+    """
+    if before is not None:
+        stmt = stmt.where(tuple_(*key) < tuple_(*before)).order_by(*(column.desc() for column in key))
+    else:
+        if after is not None:
+            stmt = stmt.where(tuple_(*key) > tuple_(*after))
+        stmt = stmt.order_by(*key)
+    return stmt.limit(limit + 1)
+
+
+def _to_page(rows: list, after: tuple | None, before: tuple | None, limit: int) -> Page:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if before is not None:
+        # Назад читали в обратном порядке
+        rows.reverse()
+        return Page(rows, has_more, True)
+    return Page(rows, after is not None, has_more)
+
+
+# Дата самой давней аренды должника — ключ сортировки отчета
+_debtor_oldest = func.min(Cart.created_at)
+
+
+class ReportCRUD:
+    """
+    Страницы админских отчетов с пагинацией по ключу (created_at, id).
+
+    Запросы страниц собирают методы *_page_query, их же проверяет
+    scripts/check_query_plans.py.
+    """
+
+    @staticmethod
+    def rentals_page_query(after: tuple | None = None, before: tuple | None = None,
+                           limit: int = REPORT_PAGE_SIZE):
+        """Активные аренды, самые давние — первыми."""
+        stmt = select(
+            Cart.id, Cart.created_at, Cart.user_id, Users.full_name, Users.phone,
+            Costumes.name.label("costume_name"), Costumes.size
+        ).join(Users, Cart.user_id == Users.id).join(Costumes, Cart.costume_id == Costumes.id)
+        return _keyset_page_query(stmt, (Cart.created_at, Cart.id), after, before, limit)
+
+    @staticmethod
+    async def rentals_page(session: AsyncSession, after: tuple | None = None, before: tuple | None = None,
+                           limit: int = REPORT_PAGE_SIZE) -> Page:
+        result = await session.execute(ReportCRUD.rentals_page_query(after, before, limit))
+        return _to_page(result.all(), after, before, limit)
+
+    @staticmethod
+    def pending_returns_page_query(after: tuple | None = None, before: tuple | None = None,
+                                   limit: int = REPORT_PAGE_SIZE):
+        """Заявки на возврат, ожидающие подтверждения."""
+        stmt = select(
+            ReturnRequest.id, ReturnRequest.created_at, ReturnRequest.user_id, Users.full_name, Users.phone,
+            Costumes.name.label("costume_name"), Costumes.size
+        ).join(Users, ReturnRequest.user_id == Users.id).join(
+            Costumes, ReturnRequest.costume_id == Costumes.id
+        ).where(ReturnRequest.status == 'pending')
+        return _keyset_page_query(stmt, (ReturnRequest.created_at, ReturnRequest.id), after, before, limit)
+
+    @staticmethod
+    async def pending_returns_page(session: AsyncSession, after: tuple | None = None, before: tuple | None = None,
+                                   limit: int = REPORT_PAGE_SIZE) -> Page:
+        result = await session.execute(ReportCRUD.pending_returns_page_query(after, before, limit))
+        return _to_page(result.all(), after, before, limit)
+
+    @staticmethod
+    def debtors_query():
+        """
+        Должники: одна строка на пользователя, сгруппированная в Postgres.
+
+        Строка содержит user_id, full_name, phone, rentals (число аренд),
+        oldest (дата самой давней аренды), max_days, days_overdue (сверх RENTAL_DAYS)
+        и costumes — список {name, size, date, days}, самые давние первыми.
+        """
+        days = cast(func.date_part('day', func.localtimestamp() - Cart.created_at), Integer) + 1
+        max_days = func.max(days)
+        return select(
+            Users.id.label("user_id"),
+            Users.full_name,
+            Users.phone,
+            func.count(Cart.id).label("rentals"),
+            _debtor_oldest.label("oldest"),
+            max_days.label("max_days"),
+            func.greatest(max_days - RENTAL_DAYS, 0).label("days_overdue"),
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        'name', Costumes.name,
+                        'size', Costumes.size,
+                        'date', func.to_char(Cart.created_at, 'DD.MM.YYYY'),
+                        'days', days
+                    ),
+                    Cart.created_at
+                ),
+                type_=JSON
+            ).label("costumes")
+        ).join(Cart, Users.id == Cart.user_id).join(
+            Costumes, Cart.costume_id == Costumes.id
+        ).group_by(Users.id)
+
+    @staticmethod
+    def debtors_page_query(after: tuple | None = None, before: tuple | None = None,
+                           limit: int = REPORT_PAGE_SIZE):
+        """
+        Страница должников по ключу (oldest, user_id): дольше всех держащие — первыми.
+
+        Пользователи страницы выбираются по ключу из легкой группировки cart
+        по user_id, и только для них debtors_query соединяет костюмы и
+        собирает json_agg. Сама группировка ключей по-прежнему проходит по
+        всем арендам на каждой странице, но без соединений и сборки списков.
+        """
+        keys = select(
+            Cart.user_id, _debtor_oldest.label("oldest")
+        ).group_by(Cart.user_id).subquery("debtor_keys")
+        page = _keyset_page_query(
+            select(keys), (keys.c.oldest, keys.c.user_id), after, before, limit
+        ).subquery("debtor_page")
+
+        order = (page.c.oldest, page.c.user_id)
+        stmt = ReportCRUD.debtors_query().join(page, page.c.user_id == Users.id).group_by(*order)
+        if before is not None:
+            return stmt.order_by(*(column.desc() for column in order))
+        return stmt.order_by(*order)
+
+    @staticmethod
+    async def debtors_page(session: AsyncSession, after: tuple | None = None, before: tuple | None = None,
+                           limit: int = REPORT_PAGE_SIZE) -> Page:
+        """Страница должников, см. debtors_page_query."""
+        result = await session.execute(ReportCRUD.debtors_page_query(after, before, limit))
+        return _to_page(result.all(), after, before, limit)
+
+
+class ImageHashCRUD:
+
+    # Больше 3 нельзя: поиск по 16-битным частям хэша гарантирует находку только до этого расстояния
+    MAX_DISTANCE = 3
+
+    @staticmethod
+    def _bands(image_hash: int) -> list:
+        return [(image_hash >> shift) & 0xFFFF for shift in (48, 32, 16, 0)]
+
+    @staticmethod
+    async def find_similar(session: AsyncSession, image_hash: int, max_distance: int = MAX_DISTANCE) -> ImageHash | None:
+        """Ищет ранее загруженное фото, чей хэш отличается не больше чем на max_distance бит."""
+        bands = ImageHashCRUD._bands(image_hash)
+        stmt = select(ImageHash).where(
+            or_(
+                ImageHash.band0 == bands[0],
+                ImageHash.band1 == bands[1],
+                ImageHash.band2 == bands[2],
+                ImageHash.band3 == bands[3]
+            )
+        )
+        result = await session.execute(stmt)
+
+        best, best_distance = None, max_distance + 1
+        for candidate in result.scalars():
+            distance = bin((candidate.hash & 0xFFFFFFFFFFFFFFFF) ^ image_hash).count('1')
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    @staticmethod
+    async def add(session: AsyncSession, image_hash: int, image_url: str, thumbnail_url: str = None) -> ImageHash:
+        bands = ImageHashCRUD._bands(image_hash)
+        record = ImageHash(
+            # В BIGINT хэш хранится со знаком
+            hash=image_hash - (1 << 64) if image_hash >= 1 << 63 else image_hash,
+            band0=bands[0],
+            band1=bands[1],
+            band2=bands[2],
+            band3=bands[3],
+            image_url=image_url,
+            thumbnail_url=thumbnail_url
+        )
+        session.add(record)
+        await session.commit()
+        return record
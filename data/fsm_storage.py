@@ -0,0 +1,190 @@
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import os
+
+from .models import FSMState
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+FLUSH_RETRY_DELAY = 1.0
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в таблице fsm_states поверх движка DataBase.
+
+    - записи сбрасывает в БД один фоновый сброс пачкой (один upsert
+      ON CONFLICT DO UPDATE и один DELETE для очищенных состояний); пока
+      идет сброс, новые изменения копятся и уходят следующей пачкой;
+    - состояния, не менявшиеся дольше FSM_TTL_SECONDS, считаются пустыми
+      и периодически удаляются.
+
+    По умолчанию чтение идет из БД, а сброс начинается сразу: так несколько
+    процессов бота видят изменения друг друга. Если чат всегда
+    обслуживает один процесс, можно включить локальный кэш
+    (FSM_CACHE_TTL > 0) и копить записи FSM_FLUSH_INTERVAL секунд.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.ttl = timedelta(seconds=int(os.getenv('FSM_TTL_SECONDS', str(7 * 24 * 3600))))
+        self.flush_interval = float(os.getenv('FSM_FLUSH_INTERVAL', '0'))
+        self.cleanup_interval = float(os.getenv('FSM_CLEANUP_INTERVAL', '3600'))
+
+        cache_ttl = float(os.getenv('FSM_CACHE_TTL', '0'))
+        self._cache = TTLCache(
+            maxsize=int(os.getenv('FSM_CACHE_SIZE', '10000')),
+            ttl=cache_ttl
+        ) if cache_ttl > 0 else None
+        # Несохраненные изменения: ключ -> (state, data)
+        self._dirty: Dict[str, tuple] = {}
+        # Пачка, которая сейчас пишется в БД
+        self._flushing: Dict[str, tuple] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{getattr(key, 'thread_id', None) or ''}:{key.destiny}"
+
+    async def _load(self, key: str) -> tuple:
+        record = self._dirty.get(key) or self._flushing.get(key)
+        if record is not None:
+            return record
+
+        if self._cache is not None:
+            record = self._cache.get(key)
+            if record is not None:
+                return record
+
+        async with self.db.async_session() as session:
+            result = await session.execute(
+                select(FSMState.state, FSMState.data).where(
+                    FSMState.key == key,
+                    FSMState.updated_at > datetime.now() - self.ttl
+                )
+            )
+            row = result.first()
+
+        record = (row.state, row.data or {}) if row else (None, {})
+        if self._cache is not None:
+            self._cache.set(key, record)
+        return record
+
+    def _store(self, key: str, record: tuple):
+        if self._cache is not None:
+            self._cache.set(key, record)
+        self._dirty[key] = record
+
+        # Сбрасывает одна задача, поэтому пачки пишутся в БД по порядку
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_expired())
+
+    async def _flush_later(self):
+        # Изменения, пришедшие во время сброса, уходят следующей пачкой
+        while self._dirty:
+            if self.flush_interval > 0:
+                await asyncio.sleep(self.flush_interval)
+            if not await self.flush():
+                await asyncio.sleep(FLUSH_RETRY_DELAY)
+
+    async def flush(self) -> bool:
+        """Сбрасывает накопленные изменения в БД одной транзакцией. Возвращает, удалось ли."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return True
+            batch, self._dirty = self._dirty, {}
+            # Пока пачка пишется, ее изменения видны при чтении
+            self._flushing = batch
+            saved = False
+            try:
+                await self._write(batch)
+                saved = True
+            except Exception as e:
+                logger.error(f"Error flushing FSM states: {e}")
+            finally:
+                self._flushing = {}
+                if not saved:
+                    # Возвращаем изменения в очередь (после ошибки или отмены), не затирая более свежие
+                    for key, record in batch.items():
+                        self._dirty.setdefault(key, record)
+            return saved
+
+    async def _write(self, batch: Dict[str, tuple]):
+        now = datetime.now()
+        cleared = [key for key, (state, data) in batch.items() if state is None and not data]
+        rows = [
+            {"key": key, "state": state, "data": data, "updated_at": now}
+            for key, (state, data) in batch.items()
+            if state is not None or data
+        ]
+
+        async with self.db.async_session() as session:
+            if rows:
+                stmt = pg_insert(FSMState).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[FSMState.key],
+                    set_={
+                        "state": stmt.excluded.state,
+                        "data": stmt.excluded.data,
+                        "updated_at": stmt.excluded.updated_at
+                    }
+                )
+                await session.execute(stmt)
+            if cleared:
+                await session.execute(delete(FSMState).where(FSMState.key.in_(cleared)))
+            await session.commit()
+
+    async def _cleanup_expired(self):
+        while True:
+            try:
+                async with self.db.async_session() as session:
+                    result = await session.execute(
+                        delete(FSMState).where(FSMState.updated_at < datetime.now() - self.ttl)
+                    )
+                    await session.commit()
+                if result.rowcount:
+                    logger.info(f"Removed {result.rowcount} expired FSM states")
+            except Exception as e:
+                logger.error(f"Error removing expired FSM states: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        _, data = await self._load(storage_key)
+        self._store(storage_key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        state, _ = await self._load(storage_key)
+        self._store(storage_key, (state, dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return dict(data)
+
+    async def close(self) -> None:
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+        # Останавливаем фоновый сброс (прерванная пачка вернется в очередь) и сохраняем остаток
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        self._flush_task = None
+        await self.flush()
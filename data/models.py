@@ -1,5 +1,5 @@
-from sqlalchemy import Column, BigInteger, Text, String, Integer, Boolean, ForeignKey, Enum, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, BigInteger, Text, String, Integer, Boolean, ForeignKey, Enum, DateTime, Computed, Index, func, text
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR, JSONB
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql.schema import UniqueConstraint
 from enum import Enum as PythonEnum
@@ -27,6 +27,9 @@ class Users(Base):
     cart_items = relationship("Cart", back_populates="user")
     return_requests = relationship("ReturnRequest", back_populates="user")
 
+# Выражения уникального ключа костюма (название, размер); ими же пользуется ON CONFLICT
+COSTUME_KEY = ("lower(btrim(name))", "lower(coalesce(btrim(size), ''))")
+
 # Сущность костюмов
 class Costumes(Base):
     __tablename__ = 'costumes'
@@ -34,34 +37,55 @@ class Costumes(Base):
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False)  # Название костюма
     image_url = Column(String, nullable=False)  # Ссылка на фото
+    thumbnail_url = Column(String, nullable=True)  # Ссылка на превью для inline-результатов
+    photo_file_id = Column(String, nullable=True)  # file_id исходного фото в Telegram
     size = Column(String, nullable=True)  # Размер костюма (опционально)
     costume_uuid = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4)  # UUID костюма
     quantity = Column(Integer, default=1)  # Количество костюмов (по умолчанию 1)
+    # Полнотекстовый вектор названия (русская морфология), вычисляется самой БД
+    search_vector = Column(
+        TSVECTOR,
+        Computed("to_tsvector('russian', coalesce(name, ''))", persisted=True)
+    )
 
     # Связь с корзиной
     cart_items = relationship("Cart", back_populates="costume")
     return_requests = relationship("ReturnRequest", back_populates="costume")
 
+    # Индексы для inline-поиска (требуют расширения pg_trgm)
+    __table_args__ = (
+        Index('ix_costumes_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_costumes_size_lower', func.lower(size)),
+        Index('ix_costumes_search_vector', 'search_vector', postgresql_using='gin'),
+        # Естественный ключ: один костюм на название и размер без учета регистра и пробелов по краям
+        Index('uq_costumes_name_size', *(text(expression) for expression in COSTUME_KEY), unique=True),
+    )
+
 # Сущность корзины (пользователь-костюм)
 class Cart(Base):
     __tablename__ = 'cart'
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # Связь с пользователем
-    costume_id = Column(BigInteger, ForeignKey('costumes.id', ondelete='CASCADE'), nullable=False)  # Связь с костюмом
+    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)  # Связь с пользователем
+    costume_id = Column(BigInteger, ForeignKey('costumes.id', ondelete='CASCADE'), nullable=False, index=True)  # Связь с костюмом
     created_at = Column(DateTime, default=datetime.now, nullable=False)  # Дата создания записи
 
     # Роли в связи
     user = relationship("Users", back_populates="cart_items")
     costume = relationship("Costumes", back_populates="cart_items")
 
+    # Отчеты и поиск просроченных аренд идут по дате выдачи (id — для стабильного порядка)
+    __table_args__ = (
+        Index('ix_cart_created_at_id', 'created_at', 'id'),
+    )
+
 # Сущность заявок на возврат костюмов
 class ReturnRequest(Base):
     __tablename__ = 'return_requests'
     
     id = Column(Integer, primary_key=True)
     request_uuid = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4)
-    user_id = Column(BigInteger, ForeignKey('users.id'))
+    user_id = Column(BigInteger, ForeignKey('users.id'), index=True)
     costume_id = Column(BigInteger, ForeignKey('costumes.id'))
     status = Column(String, default='pending')  # pending, approved, rejected
     created_at = Column(DateTime, default=datetime.now)
@@ -69,5 +93,87 @@ class ReturnRequest(Base):
     user = relationship("Users", back_populates="return_requests")
     costume = relationship("Costumes", back_populates="return_requests")
 
+    # Все горячие запросы смотрят только на ожидающие заявки, их немного
+    __table_args__ = (
+        Index('ix_return_requests_pending', 'created_at', 'id', postgresql_where=text("status = 'pending'")),
+    )
+
+# Перцептивные хэши загруженных фото костюмов (для повторного использования URL)
+class ImageHash(Base):
+    __tablename__ = 'image_hashes'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    hash = Column(BigInteger, nullable=False)  # 64-битный dHash (со знаком)
+    # Четыре 16-битные части хэша: фото на расстоянии Хэмминга до 3 совпадают хотя бы в одной
+    band0 = Column(Integer, nullable=False, index=True)
+    band1 = Column(Integer, nullable=False, index=True)
+    band2 = Column(Integer, nullable=False, index=True)
+    band3 = Column(Integer, nullable=False, index=True)
+    image_url = Column(String, nullable=False)  # Ссылка на загруженное фото
+    thumbnail_url = Column(String, nullable=True)  # Ссылка на превью
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+# Состояния FSM (диалогов) пользователей, общие для всех процессов бота
+class FSMState(Base):
+    __tablename__ = 'fsm_states'
+
+    key = Column(String, primary_key=True)  # bot_id:chat_id:user_id:thread_id:destiny
+    state = Column(String, nullable=True)  # Текущее состояние
+    data = Column(JSONB, nullable=False, default=dict)  # Данные диалога
+    updated_at = Column(DateTime, default=datetime.now, nullable=False, index=True)  # Для истечения по TTL
+
+# Рассылки сообщений пользователям
+class Broadcast(Base):
+    __tablename__ = 'broadcasts'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    text = Column(Text, nullable=False)  # Текст сообщения (HTML)
+    audience = Column(String, nullable=False)  # Кому: all, debtors
+    status = Column(String, default='pending', nullable=False)  # pending, running, done
+    created_by = Column(BigInteger, nullable=True)  # Администратор, запустивший рассылку
+    costume_id = Column(Integer, nullable=True)  # Анонсируемый костюм: по одной рассылке на костюм
+    total = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    # Обновляется работающей рассылкой; давно не обновлявшуюся подхватывает другой процесс
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Повторное нажатие «анонсировать» не создаст вторую рассылку
+        Index(
+            'uq_broadcasts_costume_id', 'costume_id', unique=True,
+            # text здесь занят колонкой с текстом рассылки
+            postgresql_where=costume_id.isnot(None)
+        ),
+    )
+
+# Получатели рассылки: по строке на чат, статус сохраняет прогресс между перезапусками
+class BroadcastRecipient(Base):
+    __tablename__ = 'broadcast_recipients'
+
+    broadcast_id = Column(Integer, ForeignKey('broadcasts.id', ondelete='CASCADE'), primary_key=True)
+    chat_id = Column(BigInteger, primary_key=True)
+    status = Column(String, default='pending', nullable=False)  # pending, sent, failed
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        # Возобновление читает только неотправленных
+        Index(
+            'ix_broadcast_recipients_pending', 'broadcast_id', 'chat_id',
+            postgresql_where=text("status = 'pending'")
+        ),
+    )
+
+# Прогресс периодических задач: до какой записи задача уже дошла
+class JobState(Base):
+    __tablename__ = 'job_state'
+
+    job = Column(String, primary_key=True)  # Имя задачи планировщика
+    watermark_at = Column(DateTime, nullable=True)  # created_at последней обработанной записи
+    watermark_id = Column(BigInteger, nullable=True)  # id последней обработанной записи
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
 # Уникальные ограничения для таблиц, если необходимо
 UniqueConstraint('phone', name='uq_users_phone')
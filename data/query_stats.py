@@ -0,0 +1,124 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+import bisect
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+# Отдельный логгер, чтобы медленные запросы можно было направить в свой файл/сборщик
+slow_query_logger = logging.getLogger("sql.slow")
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMS = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+# Счетчик запросов к БД в рамках текущего апдейта: middleware кладет сюда
+# изменяемый список [0], хук курсора увеличивает его. Контекст asyncio-задачи
+# виден и внутри greenlet, в котором SQLAlchemy выполняет запрос.
+_round_trips: ContextVar[list | None] = ContextVar("db_round_trips", default=None)
+
+
+def start_round_trip_counter() -> list:
+    """Начинает подсчет запросов для текущего контекста и возвращает счетчик."""
+    counter = [0]
+    _round_trips.set(counter)
+    return counter
+
+
+def fingerprint(statement: str) -> str:
+    """Нормализует SQL: литералы и параметры заменяются на ?, списки IN схлопываются."""
+    statement = _STRINGS.sub("?", statement)
+    statement = _PARAMS.sub("?", statement)
+    statement = _NUMBERS.sub("?", statement)
+    statement = _LISTS.sub("(?, ...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    # Последняя корзина — все, что дольше LATENCY_BUCKETS_MS[-1]
+    buckets: list = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    def record(self, elapsed_ms: float, rows: int):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += max(rows, 0)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+
+class QueryStats:
+    """
+    Статистика SQL-запросов движка по отпечаткам запросов.
+
+    Подключается к событиям before/after_cursor_execute, считает гистограммы
+    задержек и число строк, а запросы дольше slow_ms пишет в лог sql.slow.
+    """
+
+    def __init__(self, slow_ms: float = 200):
+        self.slow_ms = slow_ms
+        self._stats: dict[str, StatementStats] = {}
+
+    def attach(self, engine: AsyncEngine):
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+        counter = _round_trips.get()
+        if counter is not None:
+            counter[0] += 1
+        rows = cursor.rowcount
+        if rows is None or rows < 0:
+            # asyncpg-адаптер не заполняет rowcount для SELECT, строки уже лежат в буфере курсора
+            rows = len(getattr(cursor, "_rows", ()) or ())
+
+        key = fingerprint(statement)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = StatementStats()
+        stats.record(elapsed_ms, rows)
+
+        if elapsed_ms >= self.slow_ms:
+            slow_query_logger.warning(json.dumps({
+                "event": "slow_query",
+                "duration_ms": round(elapsed_ms, 2),
+                "rows": rows,
+                "fingerprint": key,
+                "executemany": executemany
+            }, ensure_ascii=False))
+
+    def snapshot(self, limit: int | None = None) -> list:
+        """Статистика по отпечаткам, самые затратные по суммарному времени — первыми."""
+        items = sorted(self._stats.items(), key=lambda item: item[1].total_ms, reverse=True)
+        return [
+            {
+                "fingerprint": key,
+                "count": stats.count,
+                "total_ms": round(stats.total_ms, 2),
+                "avg_ms": round(stats.total_ms / stats.count, 2),
+                "max_ms": round(stats.max_ms, 2),
+                "rows": stats.rows,
+                "buckets": dict(zip([*map(str, LATENCY_BUCKETS_MS), "+Inf"], stats.buckets))
+            }
+            for key, stats in items[:limit]
+        ]
+
+    def reset(self):
+        self._stats.clear()
@@ -1,2 +1,2 @@
 from . import (
-    questrionaire, costumes)
\ No newline at end of file
+    questrionaire, costumes, stats, export, broadcast)
\ No newline at end of file
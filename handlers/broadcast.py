@@ -0,0 +1,146 @@
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select
+from data.database import DataBase
+from data.models import Role, Broadcast, Costumes
+from keyboards.factories import BroadcastAction
+from keyboards.reply import admin_menu
+from utils.broadcast import Broadcaster, AUDIENCES
+from utils.states import BroadcastAdmin
+import html
+
+router = Router(name="broadcast")
+
+AUDIENCE_TITLES = {
+    "all": "👥 Всем пользователям",
+    "debtors": "💰 Должникам",
+}
+STATUS_TITLES = {
+    "pending": "ожидает",
+    "running": "идет",
+    "done": "завершена",
+}
+
+
+async def is_admin(user_id: int, db: DataBase) -> bool:
+    user = await db.get(user_id)
+    return bool(user and user.role == Role.Admin)
+
+
+# Обработчик кнопки "Рассылка" и команды /broadcast (только для админов)
+@router.message(Command("broadcast"))
+@router.message(F.text == "📣 Рассылка")
+async def broadcast_start(message: Message, db: DataBase):
+    if not await is_admin(message.from_user.id, db):
+        await message.answer("У вас нет доступа к этой функции.")
+        return
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=title, callback_data=BroadcastAction(action="audience", value=audience).pack())]
+        for audience, title in AUDIENCE_TITLES.items()
+    ])
+    await message.answer("📣 Кому отправить сообщение?", reply_markup=keyboard)
+
+
+@router.callback_query(BroadcastAction.filter(F.action == "audience"))
+async def broadcast_audience(callback: CallbackQuery, callback_data: BroadcastAction, state: FSMContext, db: DataBase):
+    if not await is_admin(callback.from_user.id, db) or callback_data.value not in AUDIENCES:
+        await callback.answer("У вас нет доступа к этой функции.", show_alert=True)
+        return
+
+    await state.update_data(audience=callback_data.value)
+    await state.set_state(BroadcastAdmin.input_text)
+    await callback.message.edit_text(
+        f"{AUDIENCE_TITLES[callback_data.value]}\n\nВведите текст сообщения (можно HTML-разметку):"
+    )
+    await callback.answer()
+
+
+@router.message(BroadcastAdmin.input_text, F.text)
+async def broadcast_text(message: Message, state: FSMContext):
+    await state.update_data(text=message.html_text)
+    await state.set_state(BroadcastAdmin.confirm)
+
+    data = await state.get_data()
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Отправить", callback_data=BroadcastAction(action="confirm").pack()),
+        InlineKeyboardButton(text="❌ Отмена", callback_data=BroadcastAction(action="cancel").pack())
+    ]])
+    await message.answer(
+        f"{AUDIENCE_TITLES[data['audience']]}, сообщение:\n\n{message.html_text}\n\nОтправляем?",
+        reply_markup=keyboard,
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(BroadcastAdmin.confirm, BroadcastAction.filter(F.action.in_({"confirm", "cancel"})))
+async def broadcast_confirm(callback: CallbackQuery, callback_data: BroadcastAction, state: FSMContext,
+                            db: DataBase, broadcaster: Broadcaster):
+    data = await state.get_data()
+    await state.clear()
+    if callback_data.action == "cancel":
+        await callback.message.edit_text("🚫 Рассылка отменена.")
+        await callback.answer()
+        return
+
+    broadcast_id = await broadcaster.create(data['text'], data['audience'], callback.from_user.id)
+    await callback.message.edit_text(
+        f"📣 Рассылка #{broadcast_id} запущена. Прогресс: /broadcast_status"
+    )
+    await callback.answer()
+
+
+# Анонс только что добавленного костюма всем пользователям
+@router.callback_query(BroadcastAction.filter(F.action == "costume"))
+async def broadcast_costume(callback: CallbackQuery, callback_data: BroadcastAction,
+                            db: DataBase, broadcaster: Broadcaster):
+    if not await is_admin(callback.from_user.id, db):
+        await callback.answer("У вас нет доступа к этой функции.", show_alert=True)
+        return
+
+    async with db.async_session() as session:
+        costume = await session.get(Costumes, int(callback_data.value))
+    if not costume:
+        await callback.answer("Костюм не найден.", show_alert=True)
+        return
+
+    text = (
+        f"🎭 Новый костюм: <b>{html.escape(costume.name)}</b>\n"
+        f"📏 Размер: {html.escape(costume.size or '—')}\n"
+        "Получить его можно через «📥 Получить костюм»."
+    )
+    # Кнопку убираем до создания рассылки, чтобы ее не нажали второй раз
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+    broadcast_id = await broadcaster.create(text, "all", callback.from_user.id, costume_id=costume.id)
+    if broadcast_id is None:
+        await callback.message.answer("ℹ️ Анонс этого костюма уже отправлялся. Прогресс: /broadcast_status")
+        return
+    await callback.message.answer(f"📣 Рассылка #{broadcast_id} запущена. Прогресс: /broadcast_status")
+
+
+@router.message(Command("broadcast_status"))
+async def broadcast_status(message: Message, db: DataBase):
+    if not await is_admin(message.from_user.id, db):
+        await message.answer("У вас нет доступа к этой функции.")
+        return
+
+    async with db.async_session() as session:
+        result = await session.execute(select(Broadcast).order_by(Broadcast.id.desc()).limit(5))
+        broadcasts = result.scalars().all()
+
+    if not broadcasts:
+        await message.answer("Рассылок еще не было.", reply_markup=admin_menu)
+        return
+
+    lines = ["📣 Последние рассылки:\n"]
+    for broadcast in broadcasts:
+        lines.append(
+            f"#{broadcast.id} {AUDIENCE_TITLES.get(broadcast.audience, broadcast.audience)}, "
+            f"{STATUS_TITLES.get(broadcast.status, broadcast.status)}: "
+            f"отправлено {broadcast.sent} из {broadcast.total}, ошибок {broadcast.failed}"
+        )
+    await message.answer("\n".join(lines), reply_markup=admin_menu)
@@ -1,19 +1,41 @@
 from aiogram import Router, F, Bot
-from aiogram.types import Message, InlineQuery, InlineQueryResultArticle, InputTextMessageContent, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, PhotoSize
+from aiogram.types import Message, InlineQuery, InlineQueryResultArticle, InputTextMessageContent, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, PhotoSize, InputMediaPhoto
 from aiogram.fsm.context import FSMContext
-from data.database import DataBase
+from aiogram.exceptions import TelegramBadRequest
+from data.database import DataBase, CostumeCRUD, ReportCRUD, Page, SEARCH_LIMIT
+from data.catalog import normalize
 from utils.states import CostumeRent, CostumeReturn, ReturnRequestAdmin, AddCostume
 from keyboards.reply import user_menu, admin_menu, confirm_rent_kb
-from utils.image_handler import process_costume_image
+from keyboards.factories import ReportPage, BroadcastAction
+from utils.image_handler import ingest_costume_image
+from utils.coalescing import SingleFlight, LatestQueryTracker
 from uuid import uuid4
 from sqlalchemy import select, or_, update, delete, join
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 from data.models import Costumes, Cart, Users, ReturnRequest, Role
 from datetime import datetime, timedelta
-import os
-
-router = Router()
+from typing import Any, Awaitable, Callable, NamedTuple
+import asyncio
+import html
+
+router = Router(name="costumes")
+
+# Размер одной страницы inline-результатов (Telegram допускает не больше 50)
+INLINE_PAGE_SIZE = min(20, SEARCH_LIMIT)
+# Telegram принимает в одной медиагруппе не больше 10 фото
+MEDIA_GROUP_SIZE = 10
+# Пауза в наборе текста, после которой inline-запрос уходит в БД
+INLINE_DEBOUNCE_SECONDS = 0.3
+# Сколько секунд Telegram может отдавать наш ответ всем пользователям без запроса к боту
+INLINE_CACHE_TIME = 30
+# Сколько костюмов одного должника показывать в отчете, чтобы страница влезла в сообщение
+DEBTOR_COSTUMES_SHOWN = 5
+
+# Одинаковые одновременные поиски выполняются один раз
+search_flight = SingleFlight()
+# Последний inline-запрос каждого пользователя
+inline_queries = LatestQueryTracker()
 
 # Функция для получения правильного меню на основе роли
 async def get_role_menu(user_id: int, db: DataBase):
@@ -46,41 +68,80 @@ async def get_costume_start(message: Message, state: FSMContext, db: DataBase):
         reply_markup=keyboard
     )
 
+# Поиск одной страницы костюмов (на один больше, чтобы понять, есть ли следующая)
+async def find_costumes(db: DataBase, search_text: str, offset: int) -> list:
+    if db.catalog.ready:
+        # Отвечаем из индекса каталога в памяти, без обращения к БД
+        return db.catalog.search(search_text, limit=INLINE_PAGE_SIZE + 1, offset=offset)
+
+    async with db.async_session() as session:
+        # Ищем костюмы по индексам, самые релевантные — первыми
+        return await CostumeCRUD.search(
+            session, search_text, limit=INLINE_PAGE_SIZE + 1, offset=offset
+        )
+
 # Обработчик inline режима
 @router.inline_query()
 async def inline_search(query: InlineQuery, db: DataBase):
-    search_text = query.query.lower().strip()
+    search_text = normalize(query.query)
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    next_offset = ""
     results = []
+    cacheable = False
+
+    # Популярные запросы отдаем из кэша уже отрисованными
+    cached = db.inline_cache.get((search_text, offset))
+    if cached is not None:
+        results, next_offset = cached
+        await query.answer(
+            results=results,
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=False,
+            next_offset=next_offset
+        )
+        return
 
     try:
-        async with db.async_session() as session:
-            # Получаем все костюмы из базы
-            stmt = select(Costumes).where(
-                Costumes.quantity > 0,
-                or_(
-                    Costumes.name.ilike(f"%{search_text}%"),
-                    Costumes.size.ilike(f"%{search_text}%")
-                )
-            )
-            result = await session.execute(stmt)
-            costumes = result.scalars().all()
+        if not db.catalog.ready:
+            # Запрос пойдет в БД: ждем паузу в наборе текста и отбрасываем запрос,
+            # если пользователь за это время уже отправил следующий
+            inline_queries.mark(query.from_user.id, query.id)
+            await asyncio.sleep(INLINE_DEBOUNCE_SECONDS)
+            if not inline_queries.is_latest(query.from_user.id, query.id):
+                return
+            inline_queries.forget(query.from_user.id, query.id)
 
-            # Формируем результаты для inline режима
-            for costume in costumes:
-                results.append(
-                    InlineQueryResultArticle(
-                        id=str(costume.costume_uuid),
-                        title=f"{costume.name} (Размер: {costume.size})",
-                        description=f"В наличии: {costume.quantity} шт.",
-                        thumb_url=costume.image_url,
-                        input_message_content=InputTextMessageContent(
-                            message_text=f"COSTUME_UUID:{costume.costume_uuid}"
-                        )
+        costumes = await search_flight.do(
+            (search_text, offset),
+            lambda: find_costumes(db, search_text, offset)
+        )
+
+        if len(costumes) > INLINE_PAGE_SIZE:
+            costumes = costumes[:INLINE_PAGE_SIZE]
+            next_offset = str(offset + INLINE_PAGE_SIZE)
+
+        # Кэшируем только ответы из индекса каталога: его изменения
+        # точечно сбрасывают кэш через DataBase.refresh_costume
+        cacheable = db.catalog.ready
+
+        # Формируем результаты для inline режима
+        for costume in costumes:
+            results.append(
+                InlineQueryResultArticle(
+                    id=str(costume.costume_uuid),
+                    title=f"{costume.name} (Размер: {costume.size})",
+                    description=f"В наличии: {costume.quantity} шт.",
+                    thumb_url=costume.thumbnail_url or costume.image_url,
+                    input_message_content=InputTextMessageContent(
+                        message_text=f"COSTUME_UUID:{costume.costume_uuid}"
                     )
                 )
+            )
 
     except Exception as e:
         print(f"Error in inline search: {e}")
+        next_offset = ""
+        cacheable = False
         results = [
             InlineQueryResultArticle(
                 id=str(uuid4()),
@@ -92,7 +153,8 @@ async def inline_search(query: InlineQuery, db: DataBase):
             )
         ]
 
-    if not results:
+    # Заглушку показываем только на первой странице, при прокрутке ее не нужно
+    if not results and not offset:
         results = [
             InlineQueryResultArticle(
                 id=str(uuid4()),
@@ -104,10 +166,14 @@ async def inline_search(query: InlineQuery, db: DataBase):
             )
         ]
 
+    if cacheable:
+        db.inline_cache.set((search_text, offset), (results, next_offset))
+
     await query.answer(
         results=results,
-        cache_time=5,
-        is_personal=True
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=False,
+        next_offset=next_offset
     )
 
 # Обработчик выбора костюма
@@ -131,14 +197,26 @@ async def process_costume_selection(message: Message, state: FSMContext, db: Dat
             
             # Отправляем сообщение с подтверждением
             menu = await get_role_menu(message.from_user.id, db)
-            await message.answer(
+            card_text = (
                 f"Вы хотите взять костюм:\n"
                 f"🎭 <b>{costume.name}</b>\n"
                 f"📏 Размер: {costume.size}\n"
-                f"Подтверждаете?",
-                reply_markup=confirm_rent_kb,
-                parse_mode="HTML"
+                f"Подтверждаете?"
             )
+            if costume.photo_file_id:
+                # Фото уже есть на серверах Telegram: отправляем по file_id без загрузки
+                await message.answer_photo(
+                    costume.photo_file_id,
+                    caption=card_text,
+                    reply_markup=confirm_rent_kb,
+                    parse_mode="HTML"
+                )
+            else:
+                await message.answer(
+                    card_text,
+                    reply_markup=confirm_rent_kb,
+                    parse_mode="HTML"
+                )
         else:
             menu = await get_role_menu(message.from_user.id, db)
             await message.answer("Костюм не найден. Попробуйте выбрать другой.", reply_markup=menu)
@@ -159,34 +237,16 @@ async def process_rent_confirmation(message: Message, state: FSMContext, db: Dat
 
     async with db.async_session() as session:
         try:
-            # Получаем костюм и проверяем количество
-            stmt = select(Costumes).where(Costumes.costume_uuid == costume_uuid)
-            result = await session.execute(stmt)
-            costume = result.scalar_one_or_none()
+            # Списываем костюм со склада и кладем в корзину одним запросом
+            costume = await CostumeCRUD.reserve(session, costume_uuid, message.from_user.id)
 
-            if not costume or costume.quantity <= 0:
+            if not costume:
                 menu = await get_role_menu(message.from_user.id, db)
                 await message.answer("Извините, этот костюм уже недоступен.", reply_markup=menu)
                 await state.clear()
                 return
 
-            # Уменьшаем количество костюмов
-            stmt = update(Costumes).where(
-                Costumes.costume_uuid == costume_uuid,
-                Costumes.quantity > 0
-            ).values(
-                quantity=Costumes.quantity - 1
-            )
-            await session.execute(stmt)
-
-            # Создаем запись в корзине
-            new_cart_item = Cart(
-                user_id=message.from_user.id,
-                costume_id=costume.id
-            )
-            session.add(new_cart_item)
-
-            await session.commit()
+            db.update_catalog_quantity(costume.id, costume.quantity)
 
             menu = await get_role_menu(message.from_user.id, db)
             await message.answer(
@@ -228,14 +288,37 @@ async def my_costumes(message: Message, db: DataBase):
                 )
                 return
 
+            # Костюмы с сохраненным file_id показываем галереей, фото не скачиваются заново
+            with_photo = [costume for costume in costumes if costume.photo_file_id]
+            for start in range(0, len(with_photo), MEDIA_GROUP_SIZE):
+                chunk = with_photo[start:start + MEDIA_GROUP_SIZE]
+                # Альбом должен содержать от 2 до 10 фото, одно фото отправляем отдельно
+                if len(chunk) == 1:
+                    await message.answer_photo(
+                        photo=chunk[0].photo_file_id,
+                        caption=f"🎭 <b>{chunk[0].name}</b>\n📏 Размер: {chunk[0].size}",
+                        parse_mode="HTML"
+                    )
+                    continue
+                await message.answer_media_group([
+                    InputMediaPhoto(
+                        media=costume.photo_file_id,
+                        caption=f"🎭 <b>{costume.name}</b>\n📏 Размер: {costume.size}",
+                        parse_mode="HTML"
+                    )
+                    for costume in chunk
+                ])
+
             # Формируем сообщение со списком костюмов
             response = "👔 Ваши арендованные костюмы:\n\n"
             for costume in costumes:
                 response += (
                     f"🎭 <b>{costume.name}</b>\n"
                     f"📏 Размер: {costume.size}\n"
-                    f"🖼️ Фото: {costume.image_url}\n\n"
                 )
+                if not costume.photo_file_id:
+                    response += f"🖼️ Фото: {costume.image_url}\n"
+                response += "\n"
 
             await message.answer(
                 response,
@@ -573,6 +656,8 @@ async def process_return_request_confirmation(callback: CallbackQuery, state: FS
                 return_request.status = 'rejected'
 
             await session.commit()
+            if confirmation == "yes":
+                await db.refresh_costume(return_request.costume_id)
 
             # Создаем inline-клавиатуру для возврата в меню
             menu_keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -601,229 +686,207 @@ async def process_return_request_confirmation(callback: CallbackQuery, state: FS
 
     await state.clear()
 
-# Обработчик кнопки "Поиск костюма" (только для админов)
-@router.message(F.text == "🔍 Поиск костюма")
-async def search_costumes(message: Message, db: DataBase):
-    # Проверяем, является ли пользователь администратором
-    user = await db.get(message.from_user.id)
-    if not user or user.role != Role.Admin:
-        await message.answer("У вас нет доступа к этой функции.")
-        return
+# Курсор пагинации передается в callback_data как число микросекунд от эпохи
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_micros(value: datetime) -> int:
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _days_owned(created_at: datetime) -> int:
+    return (datetime.now() - created_at).days + 1
+
+
+def _render_rentals(rows: list) -> str:
+    return "".join(
+        f"👔 <b>{html.escape(row.costume_name)}</b>\n"
+        f"👤 Арендатор: {html.escape(row.full_name)}\n"
+        f"📱 Телефон: {html.escape(row.phone)}\n"
+        f"⏳ Дней в аренде: {_days_owned(row.created_at)}\n"
+        f"📅 Дата получения: {row.created_at.strftime('%d.%m.%Y')}\n"
+        "➖➖➖➖➖➖➖➖➖➖\n"
+        for row in rows
+    )
+
+
+def _render_returns(rows: list) -> str:
+    return "".join(
+        f"👔 <b>{html.escape(row.costume_name)}</b>\n"
+        f"👤 От: {html.escape(row.full_name)}\n"
+        f"📱 Телефон: {html.escape(row.phone)}\n"
+        f"📝 Статус: Ожидает подтверждения\n"
+        "➖➖➖➖➖➖➖➖➖➖\n"
+        for row in rows
+    )
+
+
+def _render_debtors(rows: list) -> str:
+    text = ""
+    for row in rows:
+        text += (
+            f"👤 <b>{html.escape(row.full_name)}</b>\n"
+            f"📱 Телефон: {html.escape(row.phone)}\n"
+            f"📦 Костюмов: {row.rentals}, самый давний — {row.max_days} дн."
+        )
+        if row.days_overdue:
+            text += f" (просрочка {row.days_overdue} дн.)"
+        text += "\n📋 Костюмы:\n"
+        for costume in row.costumes[:DEBTOR_COSTUMES_SHOWN]:
+            text += (
+                f"  • {html.escape(costume['name'])}\n"
+                f"    ⏳ Дней в аренде: {costume['days']}\n"
+                f"    📅 Получен: {costume['date']}\n"
+            )
+        if row.rentals > DEBTOR_COSTUMES_SHOWN:
+            text += f"  … и еще {row.rentals - DEBTOR_COSTUMES_SHOWN}\n"
+        text += "➖➖➖➖➖➖➖➖➖➖\n"
+    return text
+
+
+def _row_cursor(row) -> tuple:
+    return row.created_at, row.id
+
+
+class ReportView(NamedTuple):
+    title: str
+    fetch: Callable[..., Awaitable[Page]]
+    render: Callable[[list], str]
+    empty_text: str
+    # Кнопка перехода к связанному отчету: (текст, view)
+    switch: tuple | None = None
+    # Ключ пагинации строки: (datetime, id)
+    cursor: Callable[[Any], tuple] = _row_cursor
+
+
+REPORT_VIEWS = {
+    "busy": ReportView(
+        "📋 Список занятых костюмов", ReportCRUD.rentals_page, _render_rentals,
+        "🎉 Отличные новости! Все костюмы свободны и доступны для аренды!"
+    ),
+    "rentals": ReportView(
+        "👗 Арендованные костюмы: активные аренды", ReportCRUD.rentals_page, _render_rentals,
+        "📦 Активных аренд нет.", ("📤 Заявки на возврат", "returns")
+    ),
+    "returns": ReportView(
+        "👗 Арендованные костюмы: заявки на возврат", ReportCRUD.pending_returns_page, _render_returns,
+        "📭 Заявок на возврат нет.", ("📦 Активные аренды", "rentals")
+    ),
+    "debtors": ReportView(
+        "👥 Список должников", ReportCRUD.debtors_page, _render_debtors,
+        "🎉 Отлично! На данный момент нет арендованных костюмов!", ("📤 Заявки на возврат", "returns"),
+        cursor=lambda row: (row.oldest, row.user_id)
+    ),
+}
+
+
+async def build_report(db: DataBase, page_data: ReportPage) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Загружает одну страницу отчета и собирает текст с кнопками навигации."""
+    view = REPORT_VIEWS[page_data.view]
+    paging = page_data.direction in ("prev", "next")
+    cursor = (_from_micros(page_data.ts), page_data.id) if paging else None
 
-    # Получаем все активные записи в корзине
     async with db.async_session() as session:
-        query = select(Cart, Users, Costumes).join(Users, Cart.user_id == Users.id).join(
-            Costumes, Cart.costume_id == Costumes.id
+        page = await view.fetch(
+            session,
+            after=cursor if page_data.direction == "next" else None,
+            before=cursor if page_data.direction == "prev" else None
         )
-        result = await session.execute(query)
-        cart_items = result.all()
 
-        if not cart_items:
-            await message.answer("🎉 Отличные новости! Все костюмы свободны и доступны для аренды!")
-            return
+    keyboard = []
+    if page.rows:
+        text = f"<b>{view.title}</b>\n\n" + view.render(page.rows)
+        navigation = []
+        if page.has_prev:
+            created_at, row_id = view.cursor(page.rows[0])
+            navigation.append(InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=ReportPage(
+                    view=page_data.view, direction="prev", ts=_to_micros(created_at), id=row_id
+                ).pack()
+            ))
+        if page.has_next:
+            created_at, row_id = view.cursor(page.rows[-1])
+            navigation.append(InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=ReportPage(
+                    view=page_data.view, direction="next", ts=_to_micros(created_at), id=row_id
+                ).pack()
+            ))
+        if navigation:
+            keyboard.append(navigation)
+    elif paging:
+        # Пока листали, строки успели удалить
+        text = f"<b>{view.title}</b>\n\nНа этой странице больше ничего нет."
+        keyboard.append([InlineKeyboardButton(
+            text="⏮ В начало", callback_data=ReportPage(view=page_data.view).pack()
+        )])
+    else:
+        text = view.empty_text
 
-        # Формируем красивый текст со списком занятых костюмов
-        response_text = "📋 Список занятых костюмов:\n\n"
-        
-        for cart, user, costume in cart_items:
-            # Рассчитываем количество дней владения
-            days_owned = (datetime.now() - cart.created_at).days + 1
-            
-            response_text += (
-                f"👔 *{costume.name}*\n"
-                f"👤 Арендатор: {user.full_name}\n"
-                f"📱 Телефон: {user.phone}\n"
-                f"⏳ Дней в аренде: {days_owned}\n"
-                f"📅 Дата получения: {cart.created_at.strftime('%d.%m.%Y')}\n"
-                "➖➖➖➖➖➖➖➖➖➖\n"
-            )
+    if view.switch:
+        label, target = view.switch
+        keyboard.append([InlineKeyboardButton(text=label, callback_data=ReportPage(view=target).pack())])
 
-        await message.answer(response_text, parse_mode="Markdown")
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard) if keyboard else None
 
-# Обработчик кнопки "Арендованные костюмы" (только для админов)
-@router.message(F.text == "👗 Арендованные костюмы")
-async def rented_costumes(message: Message, db: DataBase):
+
+async def send_report(message: Message, db: DataBase, view: str):
     # Проверяем, является ли пользователь администратором
     user = await db.get(message.from_user.id)
     if not user or user.role != Role.Admin:
         await message.answer("У вас нет доступа к этой функции.")
         return
 
-    # Получаем все активные записи в корзине и заявки на возврат
-    async with db.async_session() as session:
-        # Получаем активные аренды
-        cart_query = select(Cart, Users, Costumes).join(Users, Cart.user_id == Users.id).join(
-            Costumes, Cart.costume_id == Costumes.id
-        )
-        cart_result = await session.execute(cart_query)
-        cart_items = cart_result.all()
-
-        # Получаем заявки на возврат
-        return_query = select(ReturnRequest, Users, Costumes).join(
-            Users, ReturnRequest.user_id == Users.id
-        ).join(
-            Costumes, ReturnRequest.costume_id == Costumes.id
-        ).where(
-            ReturnRequest.status == 'pending'
-        )
-        return_result = await session.execute(return_query)
-        return_requests = return_result.all()
-
-        if not cart_items and not return_requests:
-            await message.answer("🎉 Отличные новости! Все костюмы свободны и доступны для аренды!")
-            return
-
-        # Формируем текст со списком арендованных костюмов
-        response_text = "👗 Арендованные костюмы:\n\n"
-        
-        # Добавляем активные аренды
-        if cart_items:
-            response_text += "📦 АКТИВНЫЕ АРЕНДЫ:\n"
-            for cart, user, costume in cart_items:
-                # Рассчитываем количество дней владения
-                days_owned = (datetime.now() - cart.created_at).days + 1
-                
-                response_text += (
-                    f"👔 *{costume.name}*\n"
-                    f"👤 Арендатор: {user.full_name}\n"
-                    f"📱 Телефон: {user.phone}\n"
-                    f"⏳ Дней в аренде: {days_owned}\n"
-                    f"📅 Дата получения: {cart.created_at.strftime('%d.%m.%Y')}\n"
-                    "➖➖➖➖➖➖➖➖➖➖\n"
-                )
+    text, keyboard = await build_report(db, ReportPage(view=view))
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
 
-        # Добавляем заявки на возврат
-        if return_requests:
-            response_text += "\n📤 ЗАЯВКИ НА ВОЗВРАТ:\n"
-            for return_request, user, costume in return_requests:
-                response_text += (
-                    f"👔 *{costume.name}*\n"
-                    f"👤 От: {user.full_name}\n"
-                    f"📱 Телефон: {user.phone}\n"
-                    f"📝 Статус: Ожидает подтверждения\n"
-                    "➖➖➖➖➖➖➖➖➖➖\n"
-                )
+# Обработчик кнопки "Поиск костюма" (только для админов)
+@router.message(F.text == "🔍 Поиск костюма")
+async def search_costumes(message: Message, db: DataBase):
+    await send_report(message, db, "busy")
 
-        # Отправляем сообщение частями, если оно слишком длинное
-        if len(response_text) > 4096:
-            for x in range(0, len(response_text), 4096):
-                await message.answer(response_text[x:x+4096], parse_mode="Markdown")
-        else:
-            await message.answer(response_text, parse_mode="Markdown")
+# Обработчик кнопки "Арендованные костюмы" (только для админов)
+@router.message(F.text == "👗 Арендованные костюмы")
+async def rented_costumes(message: Message, db: DataBase):
+    await send_report(message, db, "rentals")
 
 # Обработчик кнопки "Должники" (только для админов)
 @router.message(F.text == "💰 Должники")
 async def debtors_list(message: Message, db: DataBase):
-    # Проверяем, является ли пользователь администратором
-    user = await db.get(message.from_user.id)
+    await send_report(message, db, "debtors")
+
+# Листание страниц отчетов: сообщение редактируется на месте
+@router.callback_query(ReportPage.filter())
+async def report_page(callback: CallbackQuery, callback_data: ReportPage, db: DataBase):
+    user = await db.get(callback.from_user.id)
     if not user or user.role != Role.Admin:
-        await message.answer("У вас нет доступа к этой функции.")
+        await callback.answer("У вас нет доступа к этой функции.", show_alert=True)
+        return
+    if callback_data.view not in REPORT_VIEWS:
+        await callback.answer()
         return
 
-    # Получаем все активные аренды костюмов и заявки на возврат
-    async with db.async_session() as session:
-        # Получаем активные аренды
-        cart_query = (
-            select(Users, Costumes, Cart)
-            .join(Cart, Users.id == Cart.user_id)
-            .join(Costumes, Cart.costume_id == Costumes.id)
-        )
-        cart_result = await session.execute(cart_query)
-        rentals = cart_result.all()
-
-        # Получаем заявки на возврат
-        return_query = (
-            select(Users, Costumes, ReturnRequest)
-            .join(ReturnRequest, Users.id == ReturnRequest.user_id)
-            .join(Costumes, ReturnRequest.costume_id == Costumes.id)
-            .where(ReturnRequest.status == 'pending')
-        )
-        return_result = await session.execute(return_query)
-        return_requests = return_result.all()
-
-        if not rentals and not return_requests:
-            await message.answer("🎉 Отлично! На данный момент нет арендованных костюмов!")
-            return
-
-        # Группируем костюмы по пользователям
-        user_rentals = {}
-        user_returns = {}
-
-        # Группируем активные аренды
-        for user, costume, cart in rentals:
-            if user.id not in user_rentals:
-                user_rentals[user.id] = {
-                    'user': user,
-                    'costumes': []
-                }
-            days_owned = (datetime.now() - cart.created_at).days + 1
-            user_rentals[user.id]['costumes'].append({
-                'name': costume.name,
-                'days': days_owned,
-                'date': cart.created_at
-            })
-
-        # Группируем заявки на возврат
-        for user, costume, return_request in return_requests:
-            if user.id not in user_returns:
-                user_returns[user.id] = {
-                    'user': user,
-                    'costumes': []
-                }
-            user_returns[user.id]['costumes'].append({
-                'name': costume.name,
-                'status': 'pending'
-            })
-
-        # Формируем текст ответа
-        response_text = "👥 Список должников:\n\n"
-
-        # Добавляем активные аренды
-        if user_rentals:
-            response_text += "📦 АКТИВНЫЕ АРЕНДЫ:\n"
-            for user_data in user_rentals.values():
-                user = user_data['user']
-                response_text += f"👤 *{user.full_name}*\n📱 Телефон: {user.phone}\n📋 Костюмы:\n"
-                
-                for costume in user_data['costumes']:
-                    response_text += (
-                        f"  • {costume['name']}\n"
-                        f"    ⏳ Дней в аренде: {costume['days']}\n"
-                        f"    📅 Получен: {costume['date'].strftime('%d.%m.%Y')}\n"
-                    )
-                response_text += "➖➖➖➖➖➖➖➖➖➖\n"
-
-        # Добавляем заявки на возврат
-        if user_returns:
-            response_text += "\n📤 ЗАЯВКИ НА ВОЗВРАТ:\n"
-            for user_data in user_returns.values():
-                user = user_data['user']
-                response_text += f"👤 *{user.full_name}*\n📱 Телефон: {user.phone}\n📋 Костюмы на возврат:\n"
-                
-                for costume in user_data['costumes']:
-                    response_text += (
-                        f"  • {costume['name']}\n"
-                        f"    📝 Статус: Ожидает подтверждения\n"
-                    )
-                response_text += "➖➖➖➖➖➖➖➖➖➖\n"
-        
-        # Отправляем сообщение частями, если оно слишком длинное
-        if len(response_text) > 4096:
-            for x in range(0, len(response_text), 4096):
-                await message.answer(response_text[x:x+4096], parse_mode="Markdown")
-        else:
-            await message.answer(response_text, parse_mode="Markdown")
+    text, keyboard = await build_report(db, callback_data)
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    except TelegramBadRequest:
+        # Повторное нажатие на ту же кнопку: содержимое не изменилось
+        pass
+    await callback.answer()
 
 # Обработчик кнопки "➕ Добавить костюм"
 @router.message(F.text == "➕ Добавить костюм")
 async def add_costume_start(message: Message, state: FSMContext, db: DataBase):
     # Проверяем, является ли пользователь админом
-    async with db.async_session() as session:
-        user = await session.execute(select(Users).where(Users.id == message.from_user.id))
-        user = user.scalar()
-        if not user or user.role != Role.Admin:
-            await message.answer("У вас нет прав для выполнения этой команды.")
-            return
+    user = await db.get(message.from_user.id)
+    if not user or user.role != Role.Admin:
+        await message.answer("У вас нет прав для выполнения этой команды.")
+        return
 
     await message.answer("Введите название костюма:")
     await state.set_state(AddCostume.input_name)
@@ -860,27 +923,21 @@ async def process_costume_quantity(message: Message, state: FSMContext):
 
 # Обработчик отправки фотографии костюма
 @router.message(AddCostume.input_image, F.photo)
-async def process_costume_image_handler(message: Message, state: FSMContext, bot: Bot):
+async def process_costume_image_handler(message: Message, state: FSMContext, bot: Bot, db: DataBase):
     # Получаем последнюю (самую большую) версию фото
     photo = message.photo[-1]
     
-    # Скачиваем файл
-    file_info = await bot.get_file(photo.file_id)
-    downloaded_file = await bot.download_file(file_info.file_path)
+    # Скачиваем файл в память, без временного файла на диске
+    downloaded_file = await bot.download(photo)
     
-    # Сохраняем во временный файл
-    temp_path = f"temp_costume_{uuid4()}.jpg"
-    with open(temp_path, 'wb') as new_file:
-        new_file.write(downloaded_file.read())
-    
-    # Обрабатываем изображение через нашу функцию
-    image_url = await process_costume_image(temp_path)
-    
-    # Удаляем временный файл
-    os.remove(temp_path)
+    # Загружаем изображение (или берем уже загруженное похожее), не блокируя обработку других апдейтов
+    image = await ingest_costume_image(db, downloaded_file.getvalue())
     
     data = await state.get_data()
-    data['image_url'] = image_url
+    data['image_url'] = image.url
+    data['thumbnail_url'] = image.thumbnail_url
+    # file_id позволяет потом отправлять это фото без повторной загрузки
+    data['photo_file_id'] = photo.file_id
     await state.update_data(data)
 
     # Формируем сообщение для подтверждения
@@ -907,17 +964,34 @@ async def process_costume_confirmation(message: Message, state: FSMContext, db:
         data = await state.get_data()
         
         async with db.async_session() as session:
-            new_costume = Costumes(
+            # Тот же костюм (название и размер) не дублируется, а пополняется
+            costume = await CostumeCRUD.upsert(
+                session,
                 name=data['name'],
                 size=data['size'],
                 quantity=data['quantity'],
                 image_url=data['image_url'],
-                costume_uuid=str(uuid4())
+                thumbnail_url=data.get('thumbnail_url'),
+                photo_file_id=data.get('photo_file_id')
             )
-            session.add(new_costume)
-            await session.commit()
+        await db.refresh_costume(costume.id)
 
-        await message.answer("✅ Костюм успешно добавлен!", reply_markup=admin_menu)
+        if not costume.inserted:
+            await message.answer(
+                f"✅ Такой костюм уже есть — количество увеличено до {costume.quantity}.",
+                reply_markup=admin_menu
+            )
+        else:
+            await message.answer("✅ Костюм успешно добавлен!", reply_markup=admin_menu)
+            await message.answer(
+                "Сообщить пользователям о новом костюме?",
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                    InlineKeyboardButton(
+                        text="📣 Оповестить всех",
+                        callback_data=BroadcastAction(action="costume", value=str(costume.id)).pack()
+                    )
+                ]])
+            )
     elif message.text == "❌ Нет":
         await message.answer("🚫 Добавление костюма отменено. Спасибо!", reply_markup=admin_menu)
     else:
@@ -0,0 +1,82 @@
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from data.database import DataBase
+from data.models import Role
+from keyboards.factories import ExportRequest
+from utils.export import DATASETS, FORMATS, export_dataset
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+router = Router(name="export")
+logger = logging.getLogger(__name__)
+
+# Больше файлов бот отправить не может
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+# Одновременные выгрузки держат серверные курсоры, поэтому их число ограничено
+export_semaphore = asyncio.Semaphore(int(os.getenv('EXPORT_CONCURRENCY', '2')))
+
+
+async def is_admin(user_id: int, db: DataBase) -> bool:
+    user = await db.get(user_id)
+    return bool(user and user.role == Role.Admin)
+
+
+# Обработчик кнопки "Выгрузка" и команды /export (только для админов)
+@router.message(Command("export"))
+@router.message(F.text == "📄 Выгрузка")
+async def export_menu(message: Message, db: DataBase):
+    if not await is_admin(message.from_user.id, db):
+        await message.answer("У вас нет доступа к этой функции.")
+        return
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text=f"{dataset.title} ({fmt.upper()})",
+                callback_data=ExportRequest(dataset=key, fmt=fmt).pack()
+            )
+            for fmt in FORMATS
+        ]
+        for key, dataset in DATASETS.items()
+    ])
+    await message.answer("📄 Что выгрузить?", reply_markup=keyboard)
+
+
+@router.callback_query(ExportRequest.filter())
+async def export_file(callback: CallbackQuery, callback_data: ExportRequest, db: DataBase):
+    if not await is_admin(callback.from_user.id, db):
+        await callback.answer("У вас нет доступа к этой функции.", show_alert=True)
+        return
+    if callback_data.dataset not in DATASETS or callback_data.fmt not in FORMATS:
+        await callback.answer()
+        return
+
+    await callback.answer("⏳ Готовлю файл...")
+    async with export_semaphore:
+        try:
+            path, rows = await export_dataset(db, callback_data.dataset, callback_data.fmt)
+        except Exception as e:
+            logger.error(f"Error exporting {callback_data.dataset}: {e}")
+            await callback.message.answer("Произошла ошибка при выгрузке.")
+            return
+
+    try:
+        if os.path.getsize(path) > MAX_DOCUMENT_SIZE:
+            await callback.message.answer(
+                "Файл получился больше 50 МБ, Telegram не даст его отправить. Попробуйте формат XLSX."
+                if callback_data.fmt == "csv" else
+                "Файл получился больше 50 МБ, Telegram не даст его отправить."
+            )
+            return
+
+        title = DATASETS[callback_data.dataset].title
+        file_name = f"{callback_data.dataset}_{datetime.now().strftime('%Y%m%d_%H%M')}.{callback_data.fmt}"
+        await callback.message.answer_document(
+            FSInputFile(path, filename=file_name),
+            caption=f"📄 {title}: {rows} строк"
+        )
+    finally:
+        os.remove(path)
@@ -8,7 +8,7 @@ from utils.states import Form
 from keyboards.reply import rmk, user_menu, admin_menu
 from data.models import Role
 
-router = Router()
+router = Router(name="questrionaire")
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext, db: DataBase):
@@ -0,0 +1,69 @@
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+from data.database import DataBase
+from data.models import Role
+from keyboards.reply import user_menu
+from utils.metrics import handler_latency_window, round_trips_window, STATS_WINDOW_SECONDS
+import html
+
+router = Router(name="stats")
+
+# Сколько самых медленных обработчиков показывать
+STATS_TOP_HANDLERS = 15
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}"
+
+
+def render_stats(db: DataBase) -> str:
+    lines = [f"📊 <b>Производительность за {STATS_WINDOW_SECONDS // 60} мин</b>", ""]
+
+    sketches = handler_latency_window.snapshot()
+    if sketches:
+        # Самые медленные по p95 — первыми
+        ranked = sorted(sketches.items(), key=lambda item: item[1].quantile(0.95), reverse=True)
+        rows = [f"{'обработчик':<32} {'n':>5} {'p50':>6} {'p95':>6} {'p99':>6}"]
+        for (router_name, handler_name), sketch in ranked[:STATS_TOP_HANDLERS]:
+            name = f"{router_name}.{handler_name}"[:32]
+            rows.append(
+                f"{name:<32} {sketch.count:>5} {_ms(sketch.quantile(0.5)):>6} "
+                f"{_ms(sketch.quantile(0.95)):>6} {_ms(sketch.quantile(0.99)):>6}"
+            )
+        lines.append("<b>Обработчики</b>, мс:")
+        lines.append(f"<pre>{html.escape(chr(10).join(rows))}</pre>")
+    else:
+        lines.append("Обработчики еще не вызывались.")
+
+    round_trips = round_trips_window.snapshot()
+    if round_trips.count:
+        lines.append(
+            f"<b>Запросы к БД на апдейт</b>: p50 {round(round_trips.quantile(0.5))}, "
+            f"p95 {round(round_trips.quantile(0.95))}, p99 {round(round_trips.quantile(0.99))} "
+            f"(апдейтов: {round_trips.count})"
+        )
+
+    lines.append("")
+    lines.append("<b>Кэши</b>:")
+    for name, stats in db.cache_stats().items():
+        lines.append(
+            f"• {name}: {stats['hit_rate'] * 100:.1f}% попаданий "
+            f"({stats['hits']}/{stats['hits'] + stats['misses']}), записей: {stats['size']}"
+        )
+
+    return "\n".join(lines)
+
+
+# Обработчик команды /stats (только для администраторов)
+@router.message(Command("stats"))
+async def show_stats(message: Message, db: DataBase):
+    user = await db.get(message.from_user.id)
+    if not user or user.role != Role.Admin:
+        await message.answer(
+            "У вас нет прав для просмотра статистики.",
+            reply_markup=user_menu
+        )
+        return
+
+    await message.answer(render_stats(db), parse_mode="HTML")
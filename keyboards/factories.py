@@ -9,4 +9,26 @@ class UserAnswerData(CallbackData, prefix="answer"):
 class UserMatchData(CallbackData, prefix="match"):
     answer: str
     user_id: int | None = None
-    username: str | None = None
\ No newline at end of file
+    username: str | None = None
+
+
+class ReportPage(CallbackData, prefix="report"):
+    view: str
+    # next — страница после курсора, prev — перед ним, None — первая страница.
+    # Пустая строка не годится: при распаковке aiogram превращает пустое поле в None
+    direction: str | None = None
+    # Курсор: created_at в микросекундах от эпохи и id строки
+    ts: int = 0
+    id: int = 0
+
+
+class ExportRequest(CallbackData, prefix="export"):
+    dataset: str
+    fmt: str
+
+
+class BroadcastAction(CallbackData, prefix="broadcast"):
+    # audience — выбор получателей, confirm/cancel — запуск, costume — анонс нового костюма
+    action: str
+    # Пустая строка не годится: при распаковке aiogram превращает пустое поле в None
+    value: str | None = None
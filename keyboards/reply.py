@@ -27,11 +27,15 @@ admin_menu = ReplyKeyboardMarkup(
             KeyboardButton(text="➕ Добавить костюм")
         ],
         [
-            KeyboardButton(text="📋 Заявки на сдачу")
+            KeyboardButton(text="📋 Заявки на сдачу"),
+            KeyboardButton(text="📄 Выгрузка")
         ],
         [
             KeyboardButton(text="👗 Арендованные костюмы"),
             KeyboardButton(text="💰 Должники")
+        ],
+        [
+            KeyboardButton(text="📣 Рассылка")
         ]
     ],
     resize_keyboard=True,
@@ -1,6 +1,8 @@
 import asyncio
 import logging
+from aiohttp import web
 from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiogram.enums import ParseMode
 from aiogram.types import (
     InlineQuery,
@@ -13,6 +15,13 @@ from dotenv import load_dotenv
 from uuid import uuid4
 import handlers
 from data.database import DataBase
+from data.fsm_storage import PostgresStorage
+from utils.broadcast import Broadcaster
+from utils.scheduler import Scheduler
+from utils.reminders import send_rental_reminders, REMINDER_JOB, REMINDER_INTERVAL_SECONDS
+from utils.metrics import setup_metrics, start_metrics_server
+from utils.ordering import KeyedEventIsolation, ChatFSMContextMiddleware, UpdateConcurrencyMiddleware
+from utils import image_processing
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -21,33 +30,125 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 dp = Dispatcher()
 
 
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """
+    Запуск бота в режиме webhook на встроенном aiohttp-сервере.
+
+    Telegram получает 200 сразу, а апдейт обрабатывается фоновой задачей.
+    Если WEBHOOK_BASE_URL не задан, webhook в Telegram не регистрируется —
+    так сервер можно проверить локально, отправляя записанные апдейты
+    скриптом scripts/replay_updates.py.
+    """
+    path = os.getenv('WEBHOOK_PATH', '/webhook')
+    secret = os.getenv('WEBHOOK_SECRET')
+    base_url = os.getenv('WEBHOOK_BASE_URL')
+    host = os.getenv('WEBAPP_HOST', '0.0.0.0')
+    port = int(os.getenv('WEBAPP_PORT', '8080'))
+
+    if not secret:
+        raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+
+    if base_url:
+        async def set_webhook(bot: Bot):
+            await bot.set_webhook(
+                f"{base_url.rstrip('/')}{path}",
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=True
+            )
+        dp.startup.register(set_webhook)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Webhook server listening on {host}:{port}{path}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
 async def main():
+    metrics_runner = None
     try:
         load_dotenv()
         Token = os.getenv('BOT_TOKEN')
         bot = Bot(Token)
-        dp = Dispatcher()
         db = DataBase()
+        # Состояния диалогов храним в Postgres: переживают перезапуск и общие для всех процессов
+        storage = PostgresStorage(db)
+        # Апдейты одного чата обрабатываются по очереди: блокировка берется до чтения состояния FSM.
+        # Встроенный FSM-middleware заменен своим, чтобы inline-запросы не ждали очереди чата.
+        isolation = KeyedEventIsolation()
+        dp = Dispatcher(storage=storage, events_isolation=isolation, disable_fsm=True)
+        dp.update.outer_middleware(ChatFSMContextMiddleware(storage, isolation))
+        # Рассылки и уведомления с соблюдением лимитов Telegram
+        broadcaster = Broadcaster(bot, db)
+        # Периодические задачи; при нескольких копиях бота каждую выполняет одна
+        scheduler = Scheduler(db)
+        scheduler.add_job(
+            REMINDER_JOB, REMINDER_INTERVAL_SECONDS, lambda: send_rental_reminders(db, broadcaster)
+        )
 
         # Добавляем обработчик shutdown для корректного закрытия соединения
         async def shutdown(dispatcher):
+            await scheduler.close()
+            await broadcaster.close()
+            await storage.close()
             await db.close()
+            # Останавливаем пул процессов для превью и хэшей фото
+            await asyncio.to_thread(image_processing.shutdown)
             await bot.session.close()  # Закрываем сессию бота
         
         dp.startup.register(db.create)
+        # После создания таблиц: продолжить прерванные рассылки
+        dp.startup.register(broadcaster.start)
+        dp.startup.register(scheduler.start)
         dp.shutdown.register(shutdown)
 
         # Включаем роутеры
+        dp.include_router(handlers.stats.router)
+        dp.include_router(handlers.export.router)
+        dp.include_router(handlers.broadcast.router)
         dp.include_router(handlers.questrionaire.router)
         dp.include_router(handlers.costumes.router)  # Возвращаем роутер костюмов
 
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, db=db)
+        # Доступно всем обработчикам как аргумент db в обоих режимах запуска
+        dp["db"] = db
+        dp["broadcaster"] = broadcaster
+
+        # Апдейты разных чатов идут параллельно, но не больше UPDATE_CONCURRENCY одновременно.
+        # Регистрируется раньше метрик, поэтому время в очереди не входит в время обработки.
+        dp.update.outer_middleware(UpdateConcurrencyMiddleware(int(os.getenv('UPDATE_CONCURRENCY', '32'))))
+
+        # Метрики обработки апдейтов, обработчиков и пула соединений на /metrics
+        setup_metrics(dp, db)
+        metrics_port = int(os.getenv('METRICS_PORT', '9100'))
+        if metrics_port:
+            metrics_runner = await start_metrics_server(os.getenv('METRICS_HOST', '0.0.0.0'), metrics_port)
+
+        if os.getenv('BOT_MODE', 'polling') == 'webhook':
+            await run_webhook(bot, dp)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
         logger.info("Bot started successfully")
     except Exception as e:
         logger.error(f"Error in main: {e}")
         raise
     finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
         await bot.session.close()
 
 if __name__ == '__main__':
@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_broadcast_costume_id'
+down_revision = 'add_costume_natural_key'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('broadcasts', sa.Column('costume_id', sa.Integer(), nullable=True))
+    # Анонс костюма рассылается один раз, сколько бы раз ни нажали кнопку
+    op.create_index(
+        'uq_broadcasts_costume_id', 'broadcasts', ['costume_id'],
+        unique=True,
+        postgresql_where=sa.text("costume_id IS NOT NULL")
+    )
+
+def downgrade():
+    op.drop_index('uq_broadcasts_costume_id', table_name='broadcasts')
+    op.drop_column('broadcasts', 'costume_id')
@@ -0,0 +1,41 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_broadcasts'
+down_revision = 'add_hot_query_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'broadcasts',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('audience', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('created_by', sa.BigInteger(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sent', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('NOW()')),
+        sa.Column('finished_at', sa.DateTime(), nullable=True)
+    )
+    op.create_table(
+        'broadcast_recipients',
+        sa.Column('broadcast_id', sa.Integer(), sa.ForeignKey('broadcasts.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('chat_id', sa.BigInteger(), primary_key=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('error', sa.Text(), nullable=True)
+    )
+    # Прогресс рассылки хранится в статусах получателей, возобновление читает только pending
+    op.create_index(
+        'ix_broadcast_recipients_pending', 'broadcast_recipients', ['broadcast_id', 'chat_id'],
+        postgresql_where=sa.text("status = 'pending'")
+    )
+
+def downgrade():
+    op.drop_index('ix_broadcast_recipients_pending', table_name='broadcast_recipients')
+    op.drop_table('broadcast_recipients')
+    op.drop_table('broadcasts')
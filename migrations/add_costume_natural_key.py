@@ -0,0 +1,47 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_costume_natural_key'
+down_revision = 'add_job_state'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Сначала сливаем уже накопившиеся дубликаты: остается костюм с меньшим id,
+    # его количество — сумма по группе, аренды и заявки переводятся на него
+    op.execute("""
+        CREATE TEMP TABLE costume_merge ON COMMIT DROP AS
+        SELECT id, min(id) OVER (
+            PARTITION BY lower(btrim(name)), lower(coalesce(btrim(size), ''))
+        ) AS keeper
+        FROM costumes
+    """)
+    op.execute("DELETE FROM costume_merge WHERE id = keeper")
+    op.execute("""
+        UPDATE cart SET costume_id = m.keeper
+        FROM costume_merge AS m WHERE cart.costume_id = m.id
+    """)
+    op.execute("""
+        UPDATE return_requests SET costume_id = m.keeper
+        FROM costume_merge AS m WHERE return_requests.costume_id = m.id
+    """)
+    op.execute("""
+        UPDATE costumes SET quantity = coalesce(costumes.quantity, 0) + s.quantity
+        FROM (
+            SELECT m.keeper, sum(coalesce(c.quantity, 0)) AS quantity
+            FROM costume_merge AS m JOIN costumes AS c ON c.id = m.id
+            GROUP BY m.keeper
+        ) AS s
+        WHERE costumes.id = s.keeper
+    """)
+    op.execute("DELETE FROM costumes USING costume_merge AS m WHERE costumes.id = m.id")
+
+    op.create_index(
+        'uq_costumes_name_size', 'costumes',
+        [sa.text("lower(btrim(name))"), sa.text("lower(coalesce(btrim(size), ''))")],
+        unique=True
+    )
+
+def downgrade():
+    op.drop_index('uq_costumes_name_size', table_name='costumes')
@@ -0,0 +1,15 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_costume_photo_file_id'
+down_revision = 'add_image_hashes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # file_id фото костюма в Telegram, чтобы отправлять фото без повторной загрузки
+    op.add_column('costumes', sa.Column('photo_file_id', sa.String(), nullable=True))
+
+def downgrade():
+    op.drop_column('costumes', 'photo_file_id')
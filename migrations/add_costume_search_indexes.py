@@ -0,0 +1,33 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+# revision identifiers, used by Alembic.
+revision = 'add_costume_search_indexes'
+down_revision = 'add_created_at_to_cart'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Триграммы нужны для поиска по подстроке через GIN-индекс
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Полнотекстовый вектор названия костюма, поддерживается самой БД
+    op.add_column('costumes', sa.Column(
+        'search_vector',
+        TSVECTOR(),
+        sa.Computed("to_tsvector('russian', coalesce(name, ''))", persisted=True)
+    ))
+
+    op.create_index(
+        'ix_costumes_name_trgm', 'costumes', ['name'],
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+    op.create_index('ix_costumes_size_lower', 'costumes', [sa.text('lower(size)')])
+    op.create_index('ix_costumes_search_vector', 'costumes', ['search_vector'], postgresql_using='gin')
+
+def downgrade():
+    op.drop_index('ix_costumes_search_vector', table_name='costumes')
+    op.drop_index('ix_costumes_size_lower', table_name='costumes')
+    op.drop_index('ix_costumes_name_trgm', table_name='costumes')
+    op.drop_column('costumes', 'search_vector')
@@ -0,0 +1,15 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_costume_thumbnails'
+down_revision = 'add_fsm_states'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Ссылка на превью фото, заполняется при добавлении костюма или скриптом backfill_thumbnails
+    op.add_column('costumes', sa.Column('thumbnail_url', sa.String(), nullable=True))
+
+def downgrade():
+    op.drop_column('costumes', 'thumbnail_url')
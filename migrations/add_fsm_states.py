@@ -0,0 +1,24 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+# revision identifiers, used by Alembic.
+revision = 'add_fsm_states'
+down_revision = 'add_costume_search_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Таблица состояний FSM для PostgresStorage
+    op.create_table(
+        'fsm_states',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('state', sa.String(), nullable=True),
+        sa.Column('data', JSONB(), nullable=False, server_default=sa.text("'{}'::jsonb")),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('NOW()'))
+    )
+    op.create_index('ix_fsm_states_updated_at', 'fsm_states', ['updated_at'])
+
+def downgrade():
+    op.drop_index('ix_fsm_states_updated_at', table_name='fsm_states')
+    op.drop_table('fsm_states')
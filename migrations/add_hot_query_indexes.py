@@ -0,0 +1,30 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_hot_query_indexes'
+down_revision = 'add_costume_photo_file_id'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_cart_user_id', 'cart', ['user_id'], postgresql_concurrently=True)
+        op.create_index('ix_cart_costume_id', 'cart', ['costume_id'], postgresql_concurrently=True)
+        op.create_index('ix_cart_created_at_id', 'cart', ['created_at', 'id'], postgresql_concurrently=True)
+        op.create_index('ix_return_requests_user_id', 'return_requests', ['user_id'], postgresql_concurrently=True)
+        # Частичный индекс: ожидающих заявок мало, а именно их ищут все отчеты
+        op.create_index(
+            'ix_return_requests_pending', 'return_requests', ['created_at', 'id'],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True
+        )
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_return_requests_pending', table_name='return_requests', postgresql_concurrently=True)
+        op.drop_index('ix_return_requests_user_id', table_name='return_requests', postgresql_concurrently=True)
+        op.drop_index('ix_cart_created_at_id', table_name='cart', postgresql_concurrently=True)
+        op.drop_index('ix_cart_costume_id', table_name='cart', postgresql_concurrently=True)
+        op.drop_index('ix_cart_user_id', table_name='cart', postgresql_concurrently=True)
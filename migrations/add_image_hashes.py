@@ -0,0 +1,30 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_image_hashes'
+down_revision = 'add_costume_thumbnails'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Перцептивные хэши загруженных фото для поиска дубликатов
+    op.create_table(
+        'image_hashes',
+        sa.Column('id', sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column('hash', sa.BigInteger(), nullable=False),
+        sa.Column('band0', sa.Integer(), nullable=False),
+        sa.Column('band1', sa.Integer(), nullable=False),
+        sa.Column('band2', sa.Integer(), nullable=False),
+        sa.Column('band3', sa.Integer(), nullable=False),
+        sa.Column('image_url', sa.String(), nullable=False),
+        sa.Column('thumbnail_url', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('NOW()'))
+    )
+    for band in ('band0', 'band1', 'band2', 'band3'):
+        op.create_index(f'ix_image_hashes_{band}', 'image_hashes', [band])
+
+def downgrade():
+    for band in ('band0', 'band1', 'band2', 'band3'):
+        op.drop_index(f'ix_image_hashes_{band}', table_name='image_hashes')
+    op.drop_table('image_hashes')
@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_job_state'
+down_revision = 'add_broadcasts'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Водяные знаки периодических задач: следующий проход начинается с места, где остановился прошлый
+    op.create_table(
+        'job_state',
+        sa.Column('job', sa.String(), primary_key=True),
+        sa.Column('watermark_at', sa.DateTime(), nullable=True),
+        sa.Column('watermark_id', sa.BigInteger(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('NOW()'))
+    )
+
+def downgrade():
+    op.drop_table('job_state')
@@ -0,0 +1,89 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from sqlalchemy import select, update
+
+# Добавляем родительскую директорию в PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from data.database import DataBase
+from data.models import Costumes
+from utils.image_handler import DEFAULT_IMAGE_URL, upload_thumbnail
+
+# Сколько костюмов читаем из БД за раз и сколько обрабатываем одновременно
+BATCH_SIZE = 100
+CONCURRENCY = 8
+
+
+async def backfill_costume(http: aiohttp.ClientSession, semaphore: asyncio.Semaphore, costume_id: int, image_url: str):
+    async with semaphore:
+        try:
+            async with http.get(image_url) as response:
+                response.raise_for_status()
+                data = await response.read()
+        except Exception as e:
+            print(f"Не удалось скачать фото костюма {costume_id}: {e}")
+            return costume_id, None
+
+        return costume_id, await upload_thumbnail(data, f"costume_{costume_id}_thumb.jpg")
+
+
+async def backfill_thumbnails():
+    db = DataBase()
+    await db.ensure_database_exists()
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    started = time.perf_counter()
+    done = failed = 0
+    last_id = 0
+
+    try:
+        async with aiohttp.ClientSession() as http:
+            while True:
+                # Идем по id, чтобы не держать весь каталог в памяти
+                async with db.async_session() as session:
+                    result = await session.execute(
+                        select(Costumes.id, Costumes.image_url)
+                        .where(
+                            Costumes.id > last_id,
+                            Costumes.thumbnail_url.is_(None),
+                            Costumes.image_url != DEFAULT_IMAGE_URL
+                        )
+                        .order_by(Costumes.id)
+                        .limit(BATCH_SIZE)
+                    )
+                    batch = result.all()
+
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                thumbnails = await asyncio.gather(*(
+                    backfill_costume(http, semaphore, row.id, row.image_url) for row in batch
+                ))
+
+                async with db.async_session() as session:
+                    for costume_id, thumbnail_url in thumbnails:
+                        if thumbnail_url:
+                            await session.execute(
+                                update(Costumes).where(Costumes.id == costume_id).values(thumbnail_url=thumbnail_url)
+                            )
+                            done += 1
+                        else:
+                            failed += 1
+                    await session.commit()
+
+                print(f"Обработано: {done + failed} (ошибок: {failed})")
+
+        elapsed = time.perf_counter() - started
+        print(f"\nГотово: создано превью {done}, ошибок {failed}, за {elapsed:.1f} с")
+
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_thumbnails())
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import sys
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+# Добавляем родительскую директорию в PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.broadcast import Broadcaster, RateLimiter, BROADCAST_GLOBAL_RATE, BROADCAST_WORKERS
+
+# Замер пропускной способности рассылок без Telegram и без БД.
+#
+# Поддельная сессия Bot API отвечает с заданной задержкой и, как настоящий
+# сервер, возвращает RetryAfter при превышении 30 сообщений в секунду
+# на бота или 1 сообщения в секунду в один чат.
+#
+# Использование:
+#   python scripts/broadcast_benchmark.py --chats 1000 --repeat 0.1 --latency 0.05
+
+
+class FakeTelegramSession(BaseSession):
+    def __init__(self, latency: float, global_limit: int = 30, chat_interval: float = 1.0):
+        super().__init__()
+        self.latency = latency
+        self.global_limit = global_limit
+        self.chat_interval = chat_interval
+        self._recent: deque = deque()
+        self._last_by_chat: dict = defaultdict(float)
+        self.requests = 0
+        self.flood_errors = 0
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if not isinstance(method, SendMessage):
+            raise NotImplementedError(type(method).__name__)
+
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.global_limit or now - self._last_by_chat[method.chat_id] < self.chat_interval:
+            self.flood_errors += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+
+        self._recent.append(now)
+        self._last_by_chat[method.chat_id] = now
+        self._message_id += 1
+        return Message(
+            message_id=self._message_id,
+            date=datetime.now(),
+            chat=Chat(id=method.chat_id, type="private"),
+            text=method.text
+        )
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError
+        yield b""
+
+    async def close(self):
+        pass
+
+
+async def main(args) -> None:
+    session = FakeTelegramSession(args.latency)
+    bot = Bot("123456:benchmark", session=session)
+    broadcaster = Broadcaster(bot, limiter=RateLimiter(global_rate=args.rate), workers=args.workers)
+
+    # Часть чатов получает второе сообщение — проверка ограничения на чат
+    chat_ids = list(range(1, args.chats + 1))
+    chat_ids += chat_ids[:int(args.chats * args.repeat)]
+
+    async def messages():
+        for chat_id in chat_ids:
+            yield chat_id, f"Сообщение для {chat_id}"
+
+    stats = await broadcaster.deliver(messages())
+    print(f"Сообщений: {len(chat_ids)}, отправлено: {stats.sent}, ошибок: {stats.failed}")
+    print(f"Время: {stats.elapsed:.2f} с, скорость: {stats.rate:.1f} сообщений в секунду (лимит {args.rate:g})")
+    print(f"Запросов к API: {session.requests}, ответов RetryAfter: {session.flood_errors}, повторов: {stats.retries}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер скорости рассылки на поддельном Bot API")
+    parser.add_argument("--chats", type=int, default=500, help="число получателей")
+    parser.add_argument("--repeat", type=float, default=0.1, help="доля чатов, получающих второе сообщение")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа API, секунды")
+    parser.add_argument("--rate", type=float, default=BROADCAST_GLOBAL_RATE, help="глобальный лимит, сообщений в секунду")
+    parser.add_argument("--workers", type=int, default=BROADCAST_WORKERS, help="число воркеров")
+    asyncio.run(main(parser.parse_args()))
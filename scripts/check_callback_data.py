@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+from aiogram.filters.callback_data import CallbackData
+
+# Добавляем родительскую директорию в PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from keyboards import factories
+from keyboards.factories import UserAnswerData, UserMatchData, ReportPage, ExportRequest, BroadcastAction
+
+# Проверка фабрик callback_data: каждая кнопка, собранная так же, как в
+# обработчиках, должна распаковываться обратно в то же значение и
+# укладываться в 64 байта. Иначе фильтр Factory.filter() молча не
+# сработает и кнопка окажется мертвой.
+#
+# Использование:
+#   python scripts/check_callback_data.py
+
+MAX_CALLBACK_DATA = 64
+
+SAMPLES = [
+    UserAnswerData(answer="yes"),
+    UserAnswerData(answer="yes", user_id=123456789, username="user"),
+    UserMatchData(answer="no"),
+    UserMatchData(answer="no", user_id=123456789, username="user"),
+    ReportPage(view="returns"),
+    ReportPage(view="debtors", direction="next", ts=1_700_000_000_000_000, id=123456),
+    ReportPage(view="rentals", direction="prev", ts=1_700_000_000_000_000, id=123456),
+    ExportRequest(dataset="debtors", fmt="csv"),
+    BroadcastAction(action="audience", value="all"),
+    BroadcastAction(action="confirm"),
+    BroadcastAction(action="cancel"),
+    BroadcastAction(action="costume", value="123456"),
+]
+
+
+def check() -> bool:
+    ok = True
+    for sample in SAMPLES:
+        packed = sample.pack()
+        try:
+            unpacked = type(sample).unpack(packed)
+        except Exception as e:
+            ok = False
+            print(f"FAIL  {packed}: не распаковывается ({e.__class__.__name__})")
+            continue
+        if unpacked != sample:
+            ok = False
+            print(f"FAIL  {packed}: распаковано как {unpacked!r}")
+        elif len(packed.encode()) > MAX_CALLBACK_DATA:
+            ok = False
+            print(f"FAIL  {packed}: длиннее {MAX_CALLBACK_DATA} байт")
+        else:
+            print(f"OK    {packed}")
+
+    # Новая фабрика без примеров — тоже ошибка
+    checked = {type(sample) for sample in SAMPLES}
+    for name, value in vars(factories).items():
+        if isinstance(value, type) and issubclass(value, CallbackData) and value is not CallbackData \
+                and value not in checked:
+            ok = False
+            print(f"FAIL  {name}: нет примеров в SAMPLES")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check() else 1)
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+from sqlalchemy import select, text, func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import joinedload
+
+# Добавляем родительскую директорию в PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Проверка планов горячих запросов бота.
+#
+# Скрипт создает отдельную базу <POSTGRES_DB>_plan_check на том же сервере,
+# заполняет ее данными в масштабе боевых, выполняет EXPLAIN для каждого
+# горячего запроса и завершается с кодом 1, если какой-то из них читает
+# большую таблицу последовательным сканированием. После проверки база удаляется.
+#
+# Использование:
+#   python scripts/check_query_plans.py
+
+load_dotenv()
+MAIN_DB = os.getenv('POSTGRES_DB')
+os.environ['POSTGRES_DB'] = f"{MAIN_DB}_plan_check"
+
+from data.database import DataBase, ReportCRUD
+from data.models import Costumes, Cart, ReturnRequest
+
+USERS = 20_000
+COSTUMES = 20_000
+RENTALS = 200_000
+RETURN_REQUESTS = 200_000
+
+SAMPLE_USER = 42
+SAMPLE_COSTUME = 42
+# Ключ (created_at, id) последней строки предыдущей страницы отчета
+SAMPLE_CURSOR = (datetime.now() - timedelta(days=30), 1000)
+
+SEED_SQL = [
+    f"""
+    INSERT INTO users (id, full_name, phone, user_uuid, role)
+    SELECT i, 'Пользователь ' || i, '+7' || lpad(i::text, 10, '0'), gen_random_uuid(), 'User'
+    FROM generate_series(1, {USERS}) AS i
+    """,
+    f"""
+    INSERT INTO costumes (name, image_url, size, costume_uuid, quantity)
+    SELECT 'Костюм ' || i, 'https://example.com/' || i || '.jpg',
+           (ARRAY['S', 'M', 'L', 'XL'])[1 + i % 4], gen_random_uuid(), i % 3
+    FROM generate_series(1, {COSTUMES}) AS i
+    """,
+    f"""
+    INSERT INTO cart (user_id, costume_id, created_at)
+    SELECT 1 + i % {USERS}, 1 + (i * 7) % {COSTUMES}, now() - (i % 365) * interval '1 day'
+    FROM generate_series(1, {RENTALS}) AS i
+    """,
+    f"""
+    INSERT INTO return_requests (request_uuid, user_id, costume_id, status, created_at)
+    SELECT gen_random_uuid(), 1 + i % {USERS}, 1 + (i * 11) % {COSTUMES},
+           CASE WHEN i % 100 = 0 THEN 'pending' WHEN i % 2 = 0 THEN 'approved' ELSE 'rejected' END,
+           now() - (i % 365) * interval '1 day'
+    FROM generate_series(1, {RETURN_REQUESTS}) AS i
+    """,
+]
+
+# (название, запрос, таблицы, которые нельзя читать последовательным сканированием).
+# Запросы отчетов собираются теми же методами ReportCRUD, что и в боте.
+HOT_QUERIES = [
+    (
+        "my_costumes / return_costume_start",
+        select(Costumes).join(Cart).where(Cart.user_id == SAMPLE_USER),
+        {"cart"}
+    ),
+    (
+        "list_return_requests",
+        select(ReturnRequest).where(ReturnRequest.status == 'pending').options(
+            joinedload(ReturnRequest.costume),
+            joinedload(ReturnRequest.user)
+        ),
+        {"return_requests"}
+    ),
+    (
+        "rented_costumes: pending returns",
+        ReportCRUD.pending_returns_page_query(),
+        {"return_requests"}
+    ),
+    (
+        "rented_costumes: pending returns, next page",
+        ReportCRUD.pending_returns_page_query(after=SAMPLE_CURSOR),
+        {"return_requests"}
+    ),
+    (
+        "return requests of a user",
+        select(ReturnRequest).where(ReturnRequest.user_id == SAMPLE_USER),
+        {"return_requests"}
+    ),
+    (
+        "search_costumes / rented_costumes: rentals page",
+        ReportCRUD.rentals_page_query(),
+        {"cart"}
+    ),
+    (
+        "search_costumes / rented_costumes: rentals, previous page",
+        ReportCRUD.rentals_page_query(before=SAMPLE_CURSOR),
+        {"cart"}
+    ),
+    # Ключи страницы должников группируются по всей cart, сканируется она намеренно
+    (
+        "debtors_list: debtors page",
+        ReportCRUD.debtors_page_query(after=SAMPLE_CURSOR),
+        {"users", "costumes"}
+    ),
+    (
+        "oldest rentals",
+        select(Cart).where(Cart.created_at < func.now() - text("interval '30 days'"))
+        .order_by(Cart.created_at, Cart.id)
+        .limit(100),
+        {"cart"}
+    ),
+    (
+        "rentals of a costume",
+        select(Cart).where(Cart.costume_id == SAMPLE_COSTUME),
+        {"cart"}
+    ),
+]
+
+
+def seq_scans(plan: dict) -> set:
+    """Возвращает имена таблиц, которые план читает последовательным сканированием."""
+    tables = set()
+    if plan.get("Node Type") == "Seq Scan":
+        tables.add(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        tables |= seq_scans(child)
+    return tables
+
+
+async def check_plans(db: DataBase) -> bool:
+    ok = True
+    async with db.async_session() as session:
+        for name, stmt, protected in HOT_QUERIES:
+            sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+            result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+            plan = result.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            bad = seq_scans(plan[0]["Plan"]) & protected
+            if bad:
+                ok = False
+                print(f"FAIL  {name}: Seq Scan on {', '.join(sorted(bad))}")
+            else:
+                print(f"OK    {name}")
+    return ok
+
+
+async def drop_database():
+    conn = await asyncpg.connect(
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        host=os.getenv('POSTGRES_HOST'),
+        port=os.getenv('POSTGRES_PORT'),
+        database='postgres'
+    )
+    try:
+        await conn.execute(f"DROP DATABASE IF EXISTS {os.environ['POSTGRES_DB']}")
+    finally:
+        await conn.close()
+
+
+async def main() -> bool:
+    # Начинаем с чистой базы, даже если прошлый запуск прервался
+    await drop_database()
+
+    db = DataBase()
+    await db.create()
+    try:
+        async with db.engine.begin() as conn:
+            for statement in SEED_SQL:
+                await conn.execute(text(statement))
+            # Свежая статистика, чтобы планировщик видел реальные объемы
+            await conn.execute(text("ANALYZE"))
+        print("Тестовые данные загружены, проверяем планы запросов:\n")
+        return await check_plans(db)
+    finally:
+        await db.close()
+        await drop_database()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import text, select, func, table, column
+
+# Добавляем родительскую директорию в PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from data.database import DataBase, CostumeCRUD
+from utils.image_handler import DEFAULT_IMAGE_URL, ingest_costume_image
+
+# Массовый импорт каталога костюмов из CSV или JSON.
+#
+# Поля: name, size, quantity, image. В image — URL фото или путь к локальному
+# файлу (относительно файла импорта); локальные фото загружаются в ImageKit
+# параллельно, но не больше IMAGE_CONCURRENCY одновременно.
+#
+# Строки копируются во временную таблицу через COPY, затем одним
+# INSERT ... SELECT ... ON CONFLICT (CostumeCRUD.upsert_from_select)
+# сливаются с каталогом: у найденных по названию и размеру (без учета
+# регистра и пробелов по краям) костюмов увеличивается количество,
+# остальные добавляются. Бот увидит новые костюмы после пересинхронизации
+# каталога (CATALOG_RESYNC_SECONDS).
+#
+# Использование:
+#   python scripts/import_costumes.py costumes.csv [--images 8]
+
+IMAGE_CONCURRENCY = 8
+
+STAGING_COLUMNS = ["name", "size", "quantity", "image_url", "thumbnail_url", "costume_uuid"]
+
+# Временная таблица для COPY
+staging = table(
+    "costume_import",
+    *(column(name) for name in STAGING_COLUMNS)
+)
+
+
+def read_rows(path: Path) -> list:
+    """Читает файл импорта. Возвращает пары (номер строки файла или элемента JSON, строка)."""
+    if path.suffix.lower() == ".json":
+        with open(path, encoding="utf-8") as file:
+            return list(enumerate(json.load(file), start=1))
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        # Первая строка CSV — заголовок
+        return list(enumerate(csv.DictReader(file), start=2))
+
+
+def parse_quantity(value) -> int:
+    """Пустое количество считается за 1, иначе это должно быть целое неотрицательное число."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 1
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"некорректное количество {value!r}")
+    try:
+        quantity = int(value)
+    except ValueError:
+        raise ValueError(f"некорректное количество {value!r}") from None
+    if quantity < 0:
+        raise ValueError(f"отрицательное количество {value!r}")
+    return quantity
+
+
+def merge_duplicates(raw_rows: list) -> tuple[dict, list]:
+    """
+    Сводит строки с одинаковыми названием и размером, суммируя количество.
+
+    Возвращает костюмы и список (номер строки, ошибка) для пропущенных строк.
+    """
+    costumes = {}
+    invalid = []
+    for line, raw in raw_rows:
+        if not isinstance(raw, dict):
+            invalid.append((line, "ожидался объект с полями name, size, quantity, image"))
+            continue
+        name = (raw.get("name") or "").strip()
+        if not name:
+            continue
+        size = (raw.get("size") or "").strip() or None
+        try:
+            quantity = parse_quantity(raw.get("quantity"))
+        except ValueError as e:
+            invalid.append((line, str(e)))
+            continue
+        image = (raw.get("image") or raw.get("image_url") or "").strip() or None
+
+        key = (name.lower(), (size or "").lower())
+        if key in costumes:
+            costumes[key]["quantity"] += quantity
+            costumes[key]["image"] = costumes[key]["image"] or image
+        else:
+            costumes[key] = {"name": name, "size": size, "quantity": quantity, "image": image}
+    return costumes, invalid
+
+
+async def resolve_image(db: DataBase, semaphore: asyncio.Semaphore, base_dir: Path, costume: dict):
+    """Превращает путь к локальному файлу в загруженные URL фото и превью."""
+    image = costume.pop("image")
+    costume["image_url"] = costume["thumbnail_url"] = None
+    if not image:
+        return
+    if image.startswith(("http://", "https://")):
+        costume["image_url"] = image
+        return
+
+    async with semaphore:
+        try:
+            data = await asyncio.to_thread((base_dir / image).read_bytes)
+            uploaded = await ingest_costume_image(db, data)
+        except Exception as e:
+            print(f"Не удалось загрузить фото {image} для «{costume['name']}»: {e}")
+            return
+    if uploaded.url != DEFAULT_IMAGE_URL:
+        costume["image_url"], costume["thumbnail_url"] = uploaded.url, uploaded.thumbnail_url
+
+
+async def load(db: DataBase, costumes: list) -> tuple[int, int]:
+    records = [
+        (c["name"], c["size"], c["quantity"], c["image_url"], c["thumbnail_url"], uuid.uuid4())
+        for c in costumes
+    ]
+    async with db.engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TEMP TABLE costume_import (
+                name text NOT NULL, size text, quantity integer NOT NULL,
+                image_url text, thumbnail_url text, costume_uuid uuid NOT NULL
+            ) ON COMMIT DROP
+        """))
+        # COPY идет напрямую через asyncpg, в той же транзакции
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "costume_import", records=records, columns=STAGING_COLUMNS
+        )
+        rows = await CostumeCRUD.upsert_from_select(
+            conn,
+            STAGING_COLUMNS,
+            select(
+                staging.c.name, staging.c.size, staging.c.quantity,
+                func.coalesce(staging.c.image_url, DEFAULT_IMAGE_URL),
+                staging.c.thumbnail_url, staging.c.costume_uuid
+            )
+        )
+        inserted = sum(1 for row in rows if row.inserted)
+        return len(rows) - inserted, inserted
+
+
+async def import_costumes(path: Path, image_concurrency: int):
+    db = DataBase()
+    await db.ensure_database_exists()
+
+    try:
+        started = time.perf_counter()
+        raw_rows = read_rows(path)
+        merged, invalid = merge_duplicates(raw_rows)
+        costumes = list(merged.values())
+        print(f"Прочитано строк: {len(raw_rows)}, уникальных костюмов: {len(costumes)}")
+        if invalid:
+            print(f"Пропущено строк с ошибками: {len(invalid)}")
+            for line, error in invalid:
+                print(f"  строка {line}: {error}")
+
+        images_started = time.perf_counter()
+        semaphore = asyncio.Semaphore(image_concurrency)
+        await asyncio.gather(*(resolve_image(db, semaphore, path.parent, costume) for costume in costumes))
+        images_elapsed = time.perf_counter() - images_started
+        print(f"Фото обработаны за {images_elapsed:.2f} с")
+
+        load_started = time.perf_counter()
+        updated, inserted = await load(db, costumes)
+        load_elapsed = time.perf_counter() - load_started
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"Обновлено: {updated}, добавлено: {inserted}. "
+            f"Загрузка в БД: {load_elapsed:.2f} с ({len(costumes) / load_elapsed:.0f} строк/с), "
+            f"всего: {elapsed:.2f} с ({len(raw_rows) / elapsed:.0f} строк/с)"
+        )
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовый импорт костюмов из CSV или JSON")
+    parser.add_argument("path", type=Path, help="файл .csv или .json")
+    parser.add_argument("--images", type=int, default=IMAGE_CONCURRENCY, help="одновременных загрузок фото")
+    args = parser.parse_args()
+    asyncio.run(import_costumes(args.path, args.images))
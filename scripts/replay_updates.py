@@ -0,0 +1,49 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+# Отправляет записанные апдейты Telegram на локальный webhook бота.
+#
+# Использование:
+#   python scripts/replay_updates.py updates.json [http://localhost:8080/webhook]
+#
+# Файл — JSON-массив апдейтов или JSON Lines (по апдейту на строку).
+# Секрет берется из WEBHOOK_SECRET, как и у самого бота.
+
+
+def load_updates(path: str) -> list:
+    with open(path, encoding='utf-8') as file:
+        content = file.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+async def replay(path: str, url: str):
+    load_dotenv()
+    headers = {"X-Telegram-Bot-Api-Secret-Token": os.getenv('WEBHOOK_SECRET', '')}
+    updates = load_updates(path)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for update in updates:
+            async with session.post(url, json=update) as response:
+                if response.status != 200:
+                    print(f"Апдейт {update.get('update_id')}: HTTP {response.status}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Отправлено апдейтов: {len(updates)} за {elapsed:.2f} с ({len(updates) / elapsed:.1f} в секунду)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python scripts/replay_updates.py updates.json [url]")
+        sys.exit(1)
+
+    target_url = sys.argv[2] if len(sys.argv) > 2 else "http://localhost:8080/webhook"
+    asyncio.run(replay(sys.argv[1], target_url))
@@ -0,0 +1,375 @@
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError, TelegramServerError
+)
+from dataclasses import dataclass, field
+from sqlalchemy import select, insert, update, func, or_, text, literal, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import AsyncIterable, Awaitable, Callable
+from data.database import DataBase
+from data.models import Broadcast, BroadcastRecipient, Users, Cart
+from utils.cache import TTLCache
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Telegram пропускает около 30 сообщений в секунду на бота и 1 в секунду в один чат.
+# Глобальный лимит чуть ниже, чтобы оставался запас для ответов на апдейты.
+BROADCAST_GLOBAL_RATE = float(os.getenv('BROADCAST_GLOBAL_RATE', '25'))
+BROADCAST_PER_CHAT_RATE = float(os.getenv('BROADCAST_PER_CHAT_RATE', '1'))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '16'))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv('BROADCAST_MAX_ATTEMPTS', '5'))
+# Прогресс пишется в БД пачками: по размеру или раз в интервал
+PROGRESS_FLUSH_SIZE = 200
+PROGRESS_FLUSH_INTERVAL = 2
+# Рассылку без обновлений дольше этого времени подхватывает другой процесс
+BROADCAST_STALE_SECONDS = 60
+RECIPIENT_BATCH_SIZE = 1000
+
+# Аудитории рассылок: колонка с id чатов получателей
+AUDIENCES = {
+    "all": Users.id,
+    "debtors": Cart.user_id,
+}
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        # Ожидающие получают токены по очереди
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def block(self, seconds: float):
+        """Запрещает выдачу токенов на seconds секунд (ответ Telegram retry_after)."""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._tokens = 0
+        self._updated = max(self._updated, self._blocked_until)
+
+
+class RateLimiter:
+    """Общее ведро на бота и отдельные ведра для каждого чата."""
+
+    def __init__(self, global_rate: float = BROADCAST_GLOBAL_RATE, per_chat_rate: float = BROADCAST_PER_CHAT_RATE):
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        # Через минуту простоя ведро чата все равно было бы полным, его можно забыть
+        self._chats = TTLCache(maxsize=100_000, ttl=60)
+
+    async def acquire(self, chat_id: int):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, capacity=1)
+            self._chats.set(chat_id, bucket)
+        # Сначала ждем свой чат, чтобы не держать общий токен впустую
+        await bucket.acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, seconds: float):
+        self.global_bucket.block(seconds)
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    started: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class _Progress:
+    """Копит результаты отправки и пачками записывает их в broadcast_recipients."""
+
+    def __init__(self, db: DataBase, broadcast_id: int):
+        self.db = db
+        self.broadcast_id = broadcast_id
+        self._sent: list = []
+        self._failed: list = []
+        self._lock = asyncio.Lock()
+
+    async def add(self, chat_id: int, error: str | None):
+        if error is None:
+            self._sent.append(chat_id)
+        else:
+            self._failed.append({
+                "broadcast_id": self.broadcast_id, "chat_id": chat_id, "status": "failed", "error": error[:500]
+            })
+        if len(self._sent) + len(self._failed) >= PROGRESS_FLUSH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            sent, failed = self._sent, self._failed
+            self._sent, self._failed = [], []
+            try:
+                async with self.db.async_session() as session:
+                    if sent:
+                        await session.execute(
+                            update(BroadcastRecipient)
+                            .where(BroadcastRecipient.broadcast_id == self.broadcast_id,
+                                   BroadcastRecipient.chat_id.in_(sent))
+                            .values(status='sent')
+                        )
+                    if failed:
+                        # Обновление по первичному ключу одной пачкой (executemany)
+                        await session.execute(update(BroadcastRecipient), failed)
+                    # Заодно отмечаем, что рассылка жива
+                    await session.execute(
+                        update(Broadcast).where(Broadcast.id == self.broadcast_id).values(
+                            sent=Broadcast.sent + len(sent),
+                            failed=Broadcast.failed + len(failed),
+                            heartbeat_at=func.now()
+                        )
+                    )
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"Error saving progress of broadcast {self.broadcast_id}: {e}")
+                self._sent[:0] = sent
+                self._failed[:0] = failed
+
+    async def run_periodic(self):
+        while True:
+            await asyncio.sleep(PROGRESS_FLUSH_INTERVAL)
+            await self.flush()
+
+
+class Broadcaster:
+    """
+    Рассылки и уведомления с соблюдением лимитов Bot API.
+
+    Сообщения отправляют несколько воркеров, каждый берет токен из ведра
+    чата и из общего ведра. На TelegramRetryAfter общее ведро замирает на
+    retry_after секунд, а сообщение отправляется повторно. Получатели
+    рассылки хранятся в БД со статусом, поэтому прерванная рассылка
+    продолжается с того же места, в том числе другим процессом бота.
+    """
+
+    def __init__(self, bot: Bot, db: DataBase | None = None, limiter: RateLimiter | None = None,
+                 workers: int = BROADCAST_WORKERS):
+        self.bot = bot
+        self.db = db
+        self.limiter = limiter or RateLimiter()
+        self.workers = workers
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._watch_task: asyncio.Task | None = None
+
+    async def send(self, chat_id: int, text: str, stats: DeliveryStats | None = None) -> str | None:
+        """Отправляет одно сообщение с учетом лимитов. Возвращает текст ошибки или None."""
+        error = None
+        for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+            await self.limiter.acquire(chat_id)
+            try:
+                await self.bot.send_message(chat_id, text, parse_mode="HTML", disable_web_page_preview=True)
+                return None
+            except TelegramRetryAfter as e:
+                # Флуд-контроль действует на весь бот: притормаживаем все отправки
+                self.limiter.pause(e.retry_after)
+                error = str(e)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован или чат не найден, повтор не поможет
+                return str(e)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                await asyncio.sleep(min(2 ** attempt, 30))
+                error = str(e)
+            except Exception as e:
+                return str(e)
+            if stats:
+                stats.retries += 1
+        return error
+
+    async def deliver(self, messages: AsyncIterable[tuple[int, str]],
+                      on_result: Callable[[int, str | None], Awaitable[None]] | None = None) -> DeliveryStats:
+        """Отправляет пары (chat_id, text) параллельно воркерами и вызывает on_result для каждой."""
+        stats = DeliveryStats()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+
+        async def worker():
+            while (item := await queue.get()) is not None:
+                chat_id, text = item
+                error = await self.send(chat_id, text, stats)
+                if error is None:
+                    stats.sent += 1
+                else:
+                    stats.failed += 1
+                if on_result:
+                    try:
+                        await on_result(chat_id, error)
+                    except Exception as e:
+                        logger.error(f"Error handling delivery result for {chat_id}: {e}")
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            async for item in messages:
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        stats.finished = time.monotonic()
+        return stats
+
+    async def create(self, text: str, audience: str, created_by: int | None = None,
+                     costume_id: int | None = None) -> int | None:
+        """
+        Сохраняет рассылку со списком получателей и запускает ее. Возвращает id рассылки.
+
+        Анонс костюма (costume_id) создается один раз: если рассылка для этого
+        костюма уже есть, возвращает None.
+        """
+        async with self.db.async_session() as session:
+            result = await session.execute(
+                pg_insert(Broadcast).values(
+                    text=text, audience=audience, status='running', created_by=created_by,
+                    costume_id=costume_id, heartbeat_at=func.now()
+                ).on_conflict_do_nothing(
+                    index_elements=[Broadcast.costume_id],
+                    index_where=Broadcast.costume_id.isnot(None)
+                ).returning(Broadcast.id)
+            )
+            broadcast_id = result.scalar_one_or_none()
+            if broadcast_id is None:
+                return None
+
+            # Получатели вставляются одним INSERT ... SELECT, без выгрузки в Python
+            column = AUDIENCES[audience]
+            result = await session.execute(
+                insert(BroadcastRecipient).from_select(
+                    ["broadcast_id", "chat_id"],
+                    select(literal(broadcast_id, Integer), column).distinct()
+                )
+            )
+            await session.execute(
+                update(Broadcast).where(Broadcast.id == broadcast_id).values(total=result.rowcount)
+            )
+            await session.commit()
+
+        self._start(broadcast_id)
+        return broadcast_id
+
+    def _start(self, broadcast_id: int):
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _pending_recipients(self, broadcast_id: int, text: str):
+        # Читаем пачками по chat_id, в порядке ключа: уже прочитанных повторно не берем
+        last_chat_id = None
+        while True:
+            async with self.db.async_session() as session:
+                stmt = select(BroadcastRecipient.chat_id).where(
+                    BroadcastRecipient.broadcast_id == broadcast_id,
+                    BroadcastRecipient.status == 'pending'
+                )
+                if last_chat_id is not None:
+                    stmt = stmt.where(BroadcastRecipient.chat_id > last_chat_id)
+                result = await session.execute(stmt.order_by(BroadcastRecipient.chat_id).limit(RECIPIENT_BATCH_SIZE))
+                chat_ids = result.scalars().all()
+
+            if not chat_ids:
+                return
+            for chat_id in chat_ids:
+                yield chat_id, text
+            last_chat_id = chat_ids[-1]
+
+    async def _run(self, broadcast_id: int):
+        async with self.db.async_session() as session:
+            broadcast = await session.get(Broadcast, broadcast_id)
+            message_text = broadcast.text
+
+        progress = _Progress(self.db, broadcast_id)
+        heartbeat = asyncio.create_task(progress.run_periodic())
+        try:
+            stats = await self.deliver(self._pending_recipients(broadcast_id, message_text), progress.add)
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} interrupted: {e}")
+            return
+        finally:
+            heartbeat.cancel()
+            await progress.flush()
+
+        async with self.db.async_session() as session:
+            await session.execute(
+                update(Broadcast).where(Broadcast.id == broadcast_id).values(status='done', finished_at=func.now())
+            )
+            await session.commit()
+        logger.info(
+            f"Broadcast {broadcast_id} finished: sent {stats.sent}, failed {stats.failed}, "
+            f"retries {stats.retries}, {stats.rate:.1f} msg/s"
+        )
+
+    async def resume(self):
+        """Подхватывает рассылки, которые давно не обновлялись (процесс упал или перезапущен)."""
+        stale = func.now() - text(f"interval '{BROADCAST_STALE_SECONDS} seconds'")
+        async with self.db.async_session() as session:
+            # Захват атомарный: из нескольких процессов рассылку получит только один
+            result = await session.execute(
+                update(Broadcast).where(
+                    Broadcast.status == 'running',
+                    or_(Broadcast.heartbeat_at.is_(None), Broadcast.heartbeat_at < stale)
+                ).values(heartbeat_at=func.now()).returning(Broadcast.id)
+            )
+            broadcast_ids = result.scalars().all()
+            await session.commit()
+
+        for broadcast_id in broadcast_ids:
+            if broadcast_id not in self._tasks:
+                logger.info(f"Resuming broadcast {broadcast_id}")
+                self._start(broadcast_id)
+
+    async def _watch(self):
+        while True:
+            try:
+                await self.resume()
+            except Exception as e:
+                logger.error(f"Error resuming broadcasts: {e}")
+            await asyncio.sleep(BROADCAST_STALE_SECONDS)
+
+    async def start(self):
+        self._watch_task = asyncio.create_task(self._watch())
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        if self._watch_task:
+            tasks.append(self._watch_task)
+        for task in tasks:
+            task.cancel()
+        # Прогресс сохраняется в finally у _run
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в один.
+
+    Пока первый вызов выполняется, остальные с тем же ключом ждут его результата
+    и не запускают работу повторно.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+
+        # shield: отмена одного ожидающего не должна отменять общий вызов
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+
+class LatestQueryTracker:
+    """
+    Помнит последний inline-запрос каждого пользователя.
+
+    Позволяет отбросить запрос, если пользователь уже напечатал следующий.
+    """
+
+    def __init__(self):
+        self._latest: dict[int, str] = {}
+
+    def mark(self, user_id: int, query_id: str):
+        self._latest[user_id] = query_id
+
+    def is_latest(self, user_id: int, query_id: str) -> bool:
+        return self._latest.get(user_id) == query_id
+
+    def forget(self, user_id: int, query_id: str):
+        # Удаляем только свой запрос, чтобы словарь не рос без ограничений
+        if self._latest.get(user_id) == query_id:
+            del self._latest[user_id]
@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Any, Callable, NamedTuple
+from sqlalchemy import select, func, cast, Integer
+from data.database import DataBase, ReportCRUD
+from data.models import Cart, Costumes, Users, ReturnRequest
+import asyncio
+import csv
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк за раз читается из серверного курсора
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '2000'))
+# Предел строк на листе XLSX, дальше начинается следующий лист
+XLSX_MAX_ROWS = 1_048_576
+
+FORMATS = ("csv", "xlsx")
+
+
+class ExportDataset(NamedTuple):
+    title: str
+    headers: list
+    query: Callable[[], Any]
+    # Строка результата -> значения ячеек
+    row: Callable[[Any], list] = list
+
+
+def _rentals_query():
+    return select(
+        Cart.id, Cart.created_at,
+        cast(func.date_part('day', func.localtimestamp() - Cart.created_at), Integer) + 1,
+        Users.id, Users.full_name, Users.phone, Costumes.name, Costumes.size
+    ).join(Users, Cart.user_id == Users.id).join(
+        Costumes, Cart.costume_id == Costumes.id
+    ).order_by(Cart.created_at, Cart.id)
+
+
+def _returns_query():
+    return select(
+        ReturnRequest.id, ReturnRequest.created_at, ReturnRequest.status,
+        Users.id, Users.full_name, Users.phone, Costumes.name, Costumes.size
+    ).join(Users, ReturnRequest.user_id == Users.id).join(
+        Costumes, ReturnRequest.costume_id == Costumes.id
+    ).order_by(ReturnRequest.created_at, ReturnRequest.id)
+
+
+def _debtor_row(row) -> list:
+    costumes = "; ".join(
+        f"{costume['name']} ({costume['size']}), {costume['date']}" for costume in row.costumes
+    )
+    return [
+        row.user_id, row.full_name, row.phone, row.rentals,
+        row.oldest, row.max_days, row.days_overdue, costumes
+    ]
+
+
+DATASETS = {
+    "rentals": ExportDataset(
+        "Аренды",
+        ["ID аренды", "Дата получения", "Дней в аренде", "ID пользователя", "ФИО", "Телефон", "Костюм", "Размер"],
+        _rentals_query
+    ),
+    "debtors": ExportDataset(
+        "Должники",
+        ["ID пользователя", "ФИО", "Телефон", "Костюмов", "Самая давняя аренда",
+         "Дней в аренде (макс.)", "Дней просрочки", "Костюмы"],
+        lambda: ReportCRUD.debtors_query().order_by("oldest", "user_id"),
+        _debtor_row
+    ),
+    "returns": ExportDataset(
+        "История возвратов",
+        ["ID заявки", "Дата заявки", "Статус", "ID пользователя", "ФИО", "Телефон", "Костюм", "Размер"],
+        _returns_query
+    ),
+}
+
+
+class CsvExportWriter:
+    def __init__(self, path: str, headers: list):
+        # utf-8-sig, чтобы Excel сразу открывал кириллицу
+        self._file = open(path, "w", newline="", encoding="utf-8-sig")
+        self._writer = csv.writer(self._file, delimiter=";")
+        self._writer.writerow(headers)
+
+    def write_rows(self, rows: list):
+        self._writer.writerows(
+            [value.strftime('%d.%m.%Y %H:%M') if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        )
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxExportWriter:
+    """XLSX в режиме constant_memory: строки сразу уходят во временный файл, а не копятся в памяти."""
+
+    def __init__(self, path: str, headers: list):
+        import xlsxwriter  # Нужен только для выгрузки в XLSX
+
+        self._workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'default_date_format': 'dd.mm.yyyy hh:mm'
+        })
+        self._headers = headers
+        self._bold = self._workbook.add_format({'bold': True})
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self._sheet = self._workbook.add_worksheet()
+        self._sheet.write_row(0, 0, self._headers, self._bold)
+        self._row = 1
+
+    def write_rows(self, rows: list):
+        for row in rows:
+            if self._row == XLSX_MAX_ROWS:
+                self._new_sheet()
+            self._sheet.write_row(self._row, 0, row)
+            self._row += 1
+
+    def close(self):
+        self._workbook.close()
+
+
+async def export_dataset(db: DataBase, dataset: str, fmt: str) -> tuple[str, int]:
+    """
+    Выгружает набор данных в файл, читая строки через серверный курсор.
+
+    Args:
+        db (DataBase): База данных
+        dataset (str): Ключ из DATASETS
+        fmt (str): csv или xlsx
+
+    Returns:
+        tuple[str, int]: Путь к временному файлу (удаляет вызывающий) и число строк
+    """
+    export = DATASETS[dataset]
+    fd, path = tempfile.mkstemp(prefix=f"{dataset}_", suffix=f".{fmt}")
+    os.close(fd)
+
+    started = time.perf_counter()
+    writer = XlsxExportWriter(path, export.headers) if fmt == "xlsx" else CsvExportWriter(path, export.headers)
+    rows = 0
+    try:
+        async with db.async_session() as session:
+            result = await session.stream(export.query().execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for partition in result.partitions():
+                writer.write_rows([export.row(row) for row in partition])
+                rows += len(partition)
+    except Exception:
+        writer.close()
+        os.remove(path)
+        raise
+
+    # Упаковка XLSX в zip заметно нагружает CPU, не держим event loop
+    await asyncio.to_thread(writer.close)
+    logger.info(f"Exported {rows} rows of {dataset} to {fmt} in {time.perf_counter() - started:.2f}s")
+    return path, rows
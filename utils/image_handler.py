@@ -1,10 +1,20 @@
-from aiogram.types import PhotoSize
 from imagekitio import ImageKit
 from imagekitio.models.UploadFileRequestOptions import UploadFileRequestOptions
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import NamedTuple
+import asyncio
+import logging
 import os
+import time
 from uuid import uuid4
 from dotenv import load_dotenv
 
+from data.database import DataBase, ImageHashCRUD
+from utils.image_processing import generate_thumbnail, compute_hash
+
+logger = logging.getLogger(__name__)
+
 # Загрузка переменных окружения
 load_dotenv()
 
@@ -15,35 +25,127 @@ imagekit = ImageKit(
     url_endpoint=os.getenv('IMAGEKIT_URL_ENDPOINT')
 )
 
-async def process_costume_image(file_path: str) -> str:
+# URL, который используется, если загрузить изображение не удалось
+DEFAULT_IMAGE_URL = "https://s2.radikal.cloud/2024/11/21/photo_2024-09-17_21-51-27.jpeg"
+
+UPLOAD_RETRIES = int(os.getenv('IMAGE_UPLOAD_RETRIES', '3'))
+UPLOAD_BACKOFF_SECONDS = float(os.getenv('IMAGE_UPLOAD_BACKOFF', '0.5'))
+
+# SDK ImageKit синхронный: загрузки идут в отдельном ограниченном пуле потоков,
+# чтобы не блокировать event loop и не открывать слишком много соединений
+upload_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('IMAGE_UPLOAD_WORKERS', '4')),
+    thread_name_prefix='imagekit'
+)
+
+
+def _upload(data: bytes, file_name: str) -> str:
+    upload = imagekit.upload_file(
+        file=BytesIO(data),
+        file_name=file_name,
+        options=UploadFileRequestOptions(
+            response_fields=["is_private_file", "tags"],
+            tags=["costume"]
+        )
+    )
+    return upload.url
+
+
+async def upload_image(data: bytes, file_name: str) -> str:
+    """
+    Загружает изображение в ImageKit в пуле потоков с повторами и экспоненциальной паузой.
+
+    Raises:
+        Exception: последняя ошибка, если все попытки неудачны
+    """
+    loop = asyncio.get_running_loop()
+
+    for attempt in range(1, UPLOAD_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            url = await loop.run_in_executor(upload_executor, _upload, data, file_name)
+            logger.info(
+                f"Uploaded {file_name} ({len(data)} bytes) in "
+                f"{(time.perf_counter() - started) * 1000:.0f} ms, attempt {attempt}"
+            )
+            return url
+        except Exception as e:
+            logger.warning(f"Upload of {file_name} failed (attempt {attempt}/{UPLOAD_RETRIES}): {e}")
+            if attempt == UPLOAD_RETRIES:
+                raise
+            await asyncio.sleep(UPLOAD_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+
+class UploadedImage(NamedTuple):
+    url: str
+    thumbnail_url: str | None
+
+
+async def upload_thumbnail(data: bytes, file_name: str) -> str | None:
+    """Делает превью в пуле процессов и загружает его рядом с оригиналом."""
+    try:
+        thumbnail = await generate_thumbnail(data)
+        return await upload_image(thumbnail, file_name)
+    except Exception as e:
+        logger.error(f"Error creating thumbnail {file_name}: {str(e)}")
+        return None
+
+
+async def process_costume_image(data: bytes) -> UploadedImage:
     """
     Обработка изображения костюма с загрузкой в ImageKit.
-    
+
+    Оригинал и превью загружаются параллельно.
+
     Args:
-        file_path (str): Путь к файлу изображения
-        
+        data (bytes): Содержимое файла изображения
+
     Returns:
-        str: URL загруженного изображения
+        UploadedImage: URL загруженного изображения и его превью (None, если превью не удалось)
+    """
+    # Генерируем уникальное имя файла
+    base_name = f"costume_{str(uuid4())}"
+
+    async def upload_original() -> str:
+        try:
+            return await upload_image(data, f"{base_name}.jpg")
+        except Exception as e:
+            logger.error(f"Error uploading image: {str(e)}")
+            # В случае ошибки возвращаем URL по умолчанию
+            return DEFAULT_IMAGE_URL
+
+    url, thumbnail_url = await asyncio.gather(
+        upload_original(),
+        upload_thumbnail(data, f"{base_name}_thumb.jpg")
+    )
+    return UploadedImage(url, thumbnail_url)
+
+
+async def ingest_costume_image(db: DataBase, data: bytes) -> UploadedImage:
+    """
+    Загружает фото костюма, если такое же или почти такое же еще не загружалось.
+
+    Для фото считается перцептивный хэш; при найденном совпадении возвращаются
+    уже загруженные URL, иначе фото загружается и его хэш запоминается.
     """
     try:
-        # Генерируем уникальное имя файла
-        file_name = f"costume_{str(uuid4())}.jpg"
-        
-        # Загружаем файл в ImageKit
-        with open(file_path, 'rb') as image_file:
-            upload = imagekit.upload_file(
-                file=image_file,
-                file_name=file_name,
-                options=UploadFileRequestOptions(
-                    response_fields=["is_private_file", "tags"],
-                    tags=["costume"]
-                )
-            )
-        
-        # Возвращаем URL загруженного изображения
-        return upload.url
-        
+        image_hash = await compute_hash(data)
+        async with db.async_session() as session:
+            existing = await ImageHashCRUD.find_similar(session, image_hash)
+        if existing:
+            logger.info(f"Reusing already uploaded image {existing.image_url}")
+            return UploadedImage(existing.image_url, existing.thumbnail_url)
     except Exception as e:
-        print(f"Error uploading image: {str(e)}")
-        # В случае ошибки возвращаем URL по умолчанию
-        return "https://s2.radikal.cloud/2024/11/21/photo_2024-09-17_21-51-27.jpeg"
+        logger.error(f"Error looking up image hash: {str(e)}")
+        image_hash = None
+
+    image = await process_costume_image(data)
+
+    if image_hash is not None and image.url != DEFAULT_IMAGE_URL:
+        try:
+            async with db.async_session() as session:
+                await ImageHashCRUD.add(session, image_hash, image.url, image.thumbnail_url)
+        except Exception as e:
+            logger.error(f"Error saving image hash: {str(e)}")
+
+    return image
@@ -0,0 +1,83 @@
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Callable
+import asyncio
+import os
+
+from PIL import Image, ImageOps
+
+# Превью для списка inline-результатов: сторона не больше THUMBNAIL_SIZE пикселей
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '320'))
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '80'))
+
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Пул создается лениво, чтобы процессы не поднимались при простом импорте модуля
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=int(os.getenv('IMAGE_PROCESS_WORKERS', '2')))
+    return _process_pool
+
+
+async def run_in_process(func: Callable[..., Any], *args: Any) -> Any:
+    """Выполняет CPU-тяжелую функцию в пуле процессов, не занимая event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), func, *args)
+
+
+def make_thumbnail(data: bytes, size: int = THUMBNAIL_SIZE, quality: int = THUMBNAIL_QUALITY) -> bytes:
+    """
+    Уменьшает изображение и пережимает его в JPEG.
+
+    Args:
+        data (bytes): Исходное изображение
+        size (int): Максимальная сторона превью в пикселях
+        quality (int): Качество JPEG
+
+    Returns:
+        bytes: JPEG превью
+    """
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return output.getvalue()
+
+
+async def generate_thumbnail(data: bytes) -> bytes:
+    return await run_in_process(make_thumbnail, data)
+
+
+def perceptual_hash(data: bytes) -> int:
+    """
+    Считает 64-битный dHash изображения.
+
+    Картинка сжимается до 9x8 в оттенках серого, каждый бит — сравнение
+    соседних пикселей в строке. Похожие фото дают хэши с малым расстоянием Хэмминга.
+    """
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+        pixels = list(image.getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+async def compute_hash(data: bytes) -> int:
+    return await run_in_process(perceptual_hash, data)
+
+
+def shutdown():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
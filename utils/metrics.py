@@ -0,0 +1,245 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+from typing import Any, Awaitable, Callable, Dict
+import bisect
+import logging
+import os
+import time
+
+from data.query_stats import start_round_trip_counter
+from utils.quantiles import RollingQuantileGroup, RollingQuantiles
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+# Окно, за которое /stats показывает перцентили
+STATS_WINDOW_SECONDS = int(os.getenv('STATS_WINDOW_SECONDS', '300'))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счетчики по корзинам (последняя — +Inf), сумма, количество]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: Any):
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+        item[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip([*map(str, self.buckets), "+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class CallbackGauge:
+    """Метрика, значение которой считывается функцией в момент опроса."""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Any],
+                 labelnames: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.error(f"Error collecting metric {self.name}: {e}")
+            return lines
+
+        # Функция возвращает число или словарь {значения меток: число}
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], Any],
+              labelnames: tuple = (), kind: str = "gauge") -> CallbackGauge:
+        return self._add(CallbackGauge(name, documentation, callback, labelnames, kind))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPDATES = registry.counter("bot_updates_total", "Updates received, by update type", ("type",))
+UPDATE_ERRORS = registry.counter("bot_update_errors_total", "Updates that raised an exception", ("type",))
+UPDATE_LATENCY = registry.histogram("bot_update_duration_seconds", "Full update processing time", ("type",))
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_duration_seconds", "Handler execution time", ("router", "handler")
+)
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Handlers that raised an exception", ("router", "handler")
+)
+DB_ROUND_TRIPS = registry.histogram(
+    "bot_update_db_round_trips", "SQL statements executed per update", ("type",), ROUND_TRIP_BUCKETS
+)
+
+# Скользящие окна для /stats: (router, handler) -> задержка в секундах, и запросы к БД на апдейт
+handler_latency_window = RollingQuantileGroup(STATS_WINDOW_SECONDS)
+round_trips_window = RollingQuantiles(STATS_WINDOW_SECONDS)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: число апдейтов, ошибки и время обработки по типу апдейта."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        update_type = event.event_type
+        UPDATES.inc(update_type)
+        round_trips = start_round_trip_counter()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.inc(update_type)
+            raise
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - started, update_type)
+            DB_ROUND_TRIPS.observe(round_trips[0], update_type)
+            round_trips_window.add(round_trips[0])
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время выполнения конкретного обработчика и его роутера."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        router = data.get("event_router")
+        labels = (
+            router.name if router else "",
+            getattr(handler_object.callback, "__name__", "unknown") if handler_object else "unknown"
+        )
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(*labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_LATENCY.observe(elapsed, *labels)
+            handler_latency_window.add(labels, elapsed)
+
+
+def setup_metrics(dp, db) -> None:
+    """Подключает middleware метрик к диспетчеру и метрики пула соединений и кэшей."""
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Внутренние middleware диспетчера наследуются вложенными роутерами
+    for observer in (dp.message, dp.callback_query, dp.inline_query):
+        observer.middleware(HandlerMetricsMiddleware())
+
+    def pool_value(name: str):
+        def collect():
+            engine = getattr(db, "engine", None)
+            return getattr(engine.pool, name)() if engine else 0
+        return collect
+
+    registry.gauge("db_pool_size", "Configured connection pool size", pool_value("size"))
+    registry.gauge("db_pool_checked_out", "Connections currently checked out", pool_value("checkedout"))
+    registry.gauge("db_pool_overflow", "Connections opened above pool_size", pool_value("overflow"))
+    registry.gauge("db_pool_checked_in", "Idle connections in the pool", pool_value("checkedin"))
+
+    registry.gauge(
+        "bot_cache_hits_total", "Cache hits", lambda: {(name,): stats["hits"] for name, stats in db.cache_stats().items()},
+        labelnames=("cache",), kind="counter"
+    )
+    registry.gauge(
+        "bot_cache_misses_total", "Cache misses", lambda: {(name,): stats["misses"] for name, stats in db.cache_stats().items()},
+        labelnames=("cache",), kind="counter"
+    )
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Поднимает aiohttp-сервер с эндпоинтом /metrics в формате Prometheus."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics server listening on {host}:{port}/metrics")
+    return runner
@@ -0,0 +1,129 @@
+from aiogram import BaseMiddleware
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.types import TelegramObject, Update
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Hashable
+import asyncio
+import time
+
+from utils.metrics import registry
+
+UPDATE_QUEUE_WAIT = registry.histogram(
+    "bot_update_queue_wait_seconds", "Time an update waited for a free slot", ("type",)
+)
+
+
+class KeyedLock:
+    """Очередь на ключ: захватившие по одному ключу проходят строго по порядку прихода."""
+
+    def __init__(self):
+        # ключ -> [блокировка, сколько задач ее держат или ждут]
+        self._locks: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    async def acquire(self, key: Hashable):
+        item = self._locks.get(key)
+        if item is None:
+            item = self._locks[key] = [asyncio.Lock(), 0]
+        item[1] += 1
+        try:
+            # asyncio.Lock будит ожидающих в порядке очереди
+            await item[0].acquire()
+        except BaseException:
+            self._release_ref(key, item)
+            raise
+
+    def release(self, key: Hashable):
+        item = self._locks[key]
+        item[0].release()
+        self._release_ref(key, item)
+
+    def _release_ref(self, key: Hashable, item: list):
+        item[1] -= 1
+        # Блокировки простаивающих чатов не копятся
+        if not item[1]:
+            del self._locks[key]
+
+
+class KeyedEventIsolation(BaseEventIsolation):
+    """
+    Изоляция событий для Dispatcher: апдейты с одним ключом FSM (чат и
+    пользователь) обрабатываются строго по очереди, чтобы двойное нажатие
+    не гонялось за одно состояние.
+
+    Блокировку берет FSMContextMiddleware до чтения состояния, поэтому
+    второй апдейт увидит состояние, записанное первым. В отличие от
+    SimpleEventIsolation, блокировки простаивающих чатов не копятся.
+    """
+
+    def __init__(self):
+        self._keys = KeyedLock()
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        await self._keys.acquire(key)
+        try:
+            yield
+        finally:
+            self._keys.release(key)
+
+    async def close(self) -> None:
+        pass
+
+
+class ChatFSMContextMiddleware(FSMContextMiddleware):
+    """
+    FSMContextMiddleware, который не ставит inline-запросы в очередь чата.
+
+    У inline-запроса нет чата, и aiogram берет ключом FSM личный чат
+    пользователя: запрос ждал бы, пока закончатся его же долгие обработчики
+    (например, выгрузка отчета), а обработчик не успевал бы отбросить
+    устаревшие запросы. Состояние inline-запросам не нужно, поэтому они
+    проходят без блокировки и без state.
+
+    Подключается вместо встроенного: Dispatcher(..., disable_fsm=True).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        if event.inline_query:
+            data["fsm_storage"] = self.storage
+            return await handler(event, data)
+        return await super().__call__(handler, event, data)
+
+
+class UpdateConcurrencyMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: обрабатывается не больше max_concurrency
+    апдейтов одновременно.
+
+    Регистрируется после ChatFSMContextMiddleware, поэтому слот занимает
+    только апдейт, уже дождавшийся очереди своего чата (KeyedEventIsolation).
+    Inline-запросы не ждут ни очереди чата, ни слота: состояния у них нет,
+    а устаревшие запросы отбрасывает сам обработчик.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        if event.inline_query:
+            return await handler(event, data)
+
+        started = time.perf_counter()
+        async with self._slots:
+            UPDATE_QUEUE_WAIT.observe(time.perf_counter() - started, event.event_type)
+            return await handler(event, data)
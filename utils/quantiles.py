@@ -0,0 +1,120 @@
+from typing import Dict, Hashable
+import math
+import time
+
+
+class QuantileSketch:
+    """
+    Потоковая оценка квантилей с ограниченной памятью (по мотивам DDSketch).
+
+    Значения раскладываются по логарифмическим корзинам, поэтому любой квантиль
+    оценивается с относительной ошибкой не больше alpha. Число корзин ограничено
+    max_bins: при переполнении сливаются самые маленькие значения.
+    """
+
+    def __init__(self, alpha: float = 0.01, max_bins: int = 1024):
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self._bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 1e-9:
+            self.zero_count += 1
+            return
+
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self._bins[key] = self._bins.get(key, 0) + 1
+        if len(self._bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self._bins)
+        lowest, second = keys[0], keys[1]
+        self._bins[second] += self._bins.pop(lowest)
+
+    def merge(self, other: "QuantileSketch"):
+        for key, count in other._bins.items():
+            self._bins[key] = self._bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        while len(self._bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self._bins):
+            seen += self._bins[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self._bins) / (self.gamma + 1)
+
+
+class RollingQuantiles:
+    """
+    Квантили за скользящее окно: окно делится на слоты со своим скетчем,
+    устаревшие слоты отбрасываются. Память ограничена числом слотов.
+    """
+
+    def __init__(self, window_seconds: float = 300, slots: int = 10, alpha: float = 0.01):
+        self.slot_seconds = window_seconds / slots
+        self.slots = slots
+        self.alpha = alpha
+        # номер слота -> скетч
+        self._sketches: Dict[int, QuantileSketch] = {}
+
+    def _current_slot(self) -> int:
+        return int(time.monotonic() // self.slot_seconds)
+
+    def _expire(self, current: int):
+        for slot in [slot for slot in self._sketches if slot <= current - self.slots]:
+            del self._sketches[slot]
+
+    def add(self, value: float):
+        current = self._current_slot()
+        sketch = self._sketches.get(current)
+        if sketch is None:
+            self._expire(current)
+            sketch = self._sketches[current] = QuantileSketch(self.alpha)
+        sketch.add(value)
+
+    def snapshot(self) -> QuantileSketch:
+        """Объединенный скетч за окно."""
+        self._expire(self._current_slot())
+        merged = QuantileSketch(self.alpha)
+        for sketch in self._sketches.values():
+            merged.merge(sketch)
+        return merged
+
+
+class RollingQuantileGroup:
+    """Набор RollingQuantiles по ключу (например, по обработчику)."""
+
+    def __init__(self, window_seconds: float = 300, slots: int = 10):
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self._series: Dict[Hashable, RollingQuantiles] = {}
+
+    def add(self, key: Hashable, value: float):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = RollingQuantiles(self.window_seconds, self.slots)
+        series.add(value)
+
+    def snapshot(self) -> Dict[Hashable, QuantileSketch]:
+        result = {}
+        for key, series in self._series.items():
+            sketch = series.snapshot()
+            if sketch.count:
+                result[key] = sketch
+        return result
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from data.database import DataBase, RENTAL_DAYS
+from data.models import Cart, Costumes, JobState
+from utils.broadcast import Broadcaster
+import html
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+REMINDER_JOB = "rental_reminders"
+REMINDER_INTERVAL_SECONDS = int(os.getenv('REMINDER_INTERVAL_SECONDS', '3600'))
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '500'))
+
+
+async def _load_watermark(db: DataBase) -> tuple | None:
+    async with db.async_session() as session:
+        state = await session.get(JobState, REMINDER_JOB)
+        if state is None or state.watermark_at is None:
+            return None
+        return state.watermark_at, state.watermark_id
+
+
+async def _save_watermark(db: DataBase, watermark: tuple):
+    async with db.async_session() as session:
+        stmt = pg_insert(JobState).values(
+            job=REMINDER_JOB, watermark_at=watermark[0], watermark_id=watermark[1], updated_at=func.now()
+        )
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[JobState.job],
+            set_={
+                "watermark_at": stmt.excluded.watermark_at,
+                "watermark_id": stmt.excluded.watermark_id,
+                "updated_at": stmt.excluded.updated_at
+            }
+        ))
+        await session.commit()
+
+
+def _reminder_text(costumes: list) -> str:
+    lines = ["⏰ Напоминание: срок аренды костюма истек.\n"]
+    for name, created_at in costumes:
+        days = (datetime.now() - created_at).days + 1
+        lines.append(f"• <b>{html.escape(name)}</b> — {days} дн. (с {created_at.strftime('%d.%m.%Y')})")
+    lines.append("\nПожалуйста, верните костюм через «📤 Сдать костюм».")
+    return "\n".join(lines)
+
+
+async def send_rental_reminders(db: DataBase, broadcaster: Broadcaster):
+    """
+    Напоминает арендаторам об аренде дольше RENTAL_DAYS дней.
+
+    Проход инкрементальный: берутся только аренды, ставшие просроченными
+    после прошлого прохода, по ключу (created_at, id) от сохраненного
+    водяного знака. Запрос идет по индексу ix_cart_created_at_id, а знак
+    сохраняется после каждой пачки, чтобы сбой не повторял всю рассылку.
+    """
+    cutoff = datetime.now() - timedelta(days=RENTAL_DAYS)
+    watermark = await _load_watermark(db)
+    reminded = 0
+
+    while True:
+        async with db.async_session() as session:
+            stmt = select(Cart.id, Cart.created_at, Cart.user_id, Costumes.name).join(
+                Costumes, Cart.costume_id == Costumes.id
+            ).where(Cart.created_at <= cutoff)
+            if watermark is not None:
+                stmt = stmt.where(tuple_(Cart.created_at, Cart.id) > tuple_(*watermark))
+            result = await session.execute(
+                stmt.order_by(Cart.created_at, Cart.id).limit(REMINDER_BATCH_SIZE)
+            )
+            rows = result.all()
+
+        if not rows:
+            break
+
+        # Одно сообщение на пользователя со всеми его костюмами из пачки
+        by_user: dict = {}
+        for row in rows:
+            by_user.setdefault(row.user_id, []).append((row.name, row.created_at))
+
+        async def messages():
+            for user_id, costumes in by_user.items():
+                yield user_id, _reminder_text(costumes)
+
+        stats = await broadcaster.deliver(messages())
+        reminded += stats.sent
+
+        watermark = (rows[-1].created_at, rows[-1].id)
+        await _save_watermark(db, watermark)
+        if len(rows) < REMINDER_BATCH_SIZE:
+            break
+
+    if reminded:
+        logger.info(f"Sent {reminded} overdue rental reminders")
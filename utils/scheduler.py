@@ -0,0 +1,66 @@
+from sqlalchemy import select, func
+from typing import Awaitable, Callable
+from data.database import DataBase
+import asyncio
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """
+    Периодические задачи бота с выбором исполнителя через advisory lock.
+
+    Перед каждым запуском задача берет pg_try_advisory_lock со своим ключом.
+    Если запущено несколько копий бота, задачу выполнит та, что успела взять
+    блокировку, остальные пропустят этот проход.
+    """
+
+    def __init__(self, db: DataBase):
+        self.db = db
+        self._jobs: list = []
+        self._tasks: list = []
+
+    def add_job(self, name: str, interval: float, job: Callable[[], Awaitable[None]]):
+        self._jobs.append((name, interval, job))
+
+    @staticmethod
+    def lock_key(name: str) -> int:
+        # hash() для строк меняется между запусками, а ключ должен совпадать у всех процессов
+        return zlib.crc32(f"scheduler:{name}".encode())
+
+    async def run_once(self, name: str, job: Callable[[], Awaitable[None]]) -> bool:
+        """Выполняет задачу, если блокировку удалось взять. Возвращает, выполнялась ли она."""
+        key = self.lock_key(name)
+        # Блокировка сессионная: держим одно соединение до ее снятия
+        async with self.db.engine.connect() as conn:
+            locked = await conn.scalar(select(func.pg_try_advisory_lock(key)))
+            await conn.commit()
+            if not locked:
+                logger.debug(f"Job {name} is running in another process, skipping")
+                return False
+            try:
+                await job()
+            finally:
+                await conn.scalar(select(func.pg_advisory_unlock(key)))
+                await conn.commit()
+        return True
+
+    async def _loop(self, name: str, interval: float, job: Callable[[], Awaitable[None]]):
+        while True:
+            try:
+                await self.run_once(name, job)
+            except Exception as e:
+                logger.error(f"Error in job {name}: {e}")
+            await asyncio.sleep(interval)
+
+    async def start(self):
+        for name, interval, job in self._jobs:
+            self._tasks.append(asyncio.create_task(self._loop(name, interval, job)))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
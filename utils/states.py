@@ -32,4 +32,7 @@ class AddCostume(StatesGroup):
     input_size = State()
     input_quantity = State()
     input_image = State()
-    confirm = State()
\ No newline at end of file
+    confirm = State()
+class BroadcastAdmin(StatesGroup):
+    input_text = State()
+    confirm = State()